@@ -26,9 +26,15 @@ layer_height = 0.15
 #print speed mm/s
 print_speed = 40
 
-#infill_percentage (only supports 100% currently)
+#infill_percentage
 infill_percentage = 100
 
+#infill pattern used below 100% infill ("rectilinear" or "grid")
+infill_pattern = "rectilinear"
+
+#number of solid layers closest to and furthest from the cylinder
+solid_layer_count = 3
+
 #temperature of hotend (celsius)
 print_temperature = 200
 
@@ -44,6 +50,15 @@ nozzle_diameter = 0.4
 #wall line count
 wall_line_count = 1
 
+#number of processes used to slice the layers (1 slices in this process)
+process_count = 1
+
+#directory of the cache of sliced models (None to not cache models)
+cache_directory = "CACHE"
+
+#maximum size of the cache of sliced models (MB)
+cache_size = 1000
+
 #start gcode (when modifying make sure the variable names remain the same)
 start_gcode = ("M82 ;absolute extrusion mode\n" + 
                "G21 ; set units to millimeters\n" + 
@@ -95,7 +110,7 @@ delta_y = 97
 #filament diameter
 filament_diameter = 1.75
 
-#Infill orientation options (0, 90) - alternating or (45, 135) - alternating
+#Infill orientation (degrees) - alternates with the orientation + 90 degrees
 infill_orientation = 45
 
 #Imports
@@ -23,6 +23,112 @@ Last updated: October 26, 2020
 #Imports
 import numpy as np
 from stl import mesh
+from typing import Iterator
+from multiprocessing import shared_memory
+
+class growable_array:
+    """
+    Array of rows with a fixed width that grows by doubling its capacity.
+    Appending n rows one at a time costs O(n) copies in total instead of 
+    the O(n^2) of repeated np.append calls. The buffer can be cleared and
+    reused once its contents have been copied out.
+    """
+    def __init__(self, width:int, capacity:int = 64):
+        self.data = np.empty((capacity, width))
+        self.size = 0
+        
+    def __len__(self) -> int:
+        return self.size
+    
+    def append(self, rows:np.ndarray) -> None:
+        rows = np.asarray(rows).reshape(-1, self.data.shape[1])
+        end = self.size + len(rows)
+        if end > len(self.data):
+            capacity = len(self.data)
+            while capacity < end:
+                capacity *= 2
+            data = np.empty((capacity, self.data.shape[1]))
+            data[:self.size] = self.data[:self.size]
+            self.data = data
+        self.data[self.size:end] = rows
+        self.size = end
+        
+    def copy(self) -> np.ndarray:
+        return self.data[:self.size].copy()
+    
+    def clear(self) -> None:
+        self.size = 0
+
+class point_grid:
+    """
+    Uniform grid of points that finds the nearest remaining point to a 
+    position without comparing it to every point. The points are placed 
+    in square cells sized so there is about one point per cell. The cells
+    are searched in rings around the cell of the position: once the 
+    closest point found is closer than k * cell_size after ring k, no 
+    point in a further ring can be closer. When a ring has more cells than
+    there are points left the remaining points are compared directly. 
+    Ties are broken by the lowest index like np.argmin.
+    """
+    def __init__(self, points:np.ndarray):
+        self.point_array = points
+        self.points = points.tolist()
+        self.remaining = np.ones(len(points), dtype = bool)
+        self.num_remaining = len(points)
+        self.lower = np.amin(points, axis = 0)
+        span = np.amax(points, axis = 0) - self.lower
+        self.cell_size = max(np.amax(span) / np.sqrt(len(points)), 1e-9)
+        cells = np.floor((points - self.lower) / self.cell_size).astype(np.int64)
+        self.num_cells = (np.amax(cells, axis = 0) + 1).tolist()
+        self.cells = dict()
+        for i, cell in enumerate(map(tuple, cells.tolist())):
+            self.cells.setdefault(cell, []).append(i)
+        self.cell_of = cells.tolist()
+        
+    def remove(self, point:int) -> None:
+        self.remaining[point] = False
+        self.num_remaining -= 1
+        self.cells[tuple(self.cell_of[point])].remove(point)
+        
+    def ring(self, cell_x:int, cell_y:int, k:int) -> Iterator:
+        """
+        Yields the cells of the grid whose offset from (cell_x, cell_y) 
+        is k cells along either axis.
+        """
+        num_x, num_y = self.num_cells
+        y_range = range(max(cell_y - k, 0), min(cell_y + k, num_y - 1) + 1)
+        for x in range(max(cell_x - k, 0), min(cell_x + k, num_x - 1) + 1):
+            if abs(x - cell_x) == k:
+                for y in y_range:
+                    yield x, y
+            else:
+                for y in (cell_y - k, cell_y + k):
+                    if 0 <= y < num_y and k != 0:
+                        yield x, y
+    
+    def nearest(self, position:np.ndarray) -> int:
+        x, y = float(position[0]), float(position[1])
+        cell_x, cell_y = np.floor((position - self.lower) / 
+                                  self.cell_size).astype(np.int64).tolist()
+        num_x, num_y = self.num_cells
+        max_ring = max(cell_x, num_x - 1 - cell_x, cell_y, num_y - 1 - cell_y, 0)
+        best, best_distance = -1, np.inf
+        for k in range(max_ring + 1):
+            if 8 * k > self.num_remaining:
+                remaining = np.flatnonzero(self.remaining)
+                points = self.point_array[remaining]
+                distances = np.sum((points - position) ** 2, axis = 1)
+                return int(remaining[np.argmin(distances)])
+            for cell in self.ring(cell_x, cell_y, k):
+                for i in self.cells.get(cell, ()):
+                    d_x, d_y = self.points[i][0] - x, self.points[i][1] - y
+                    distance = d_x * d_x + d_y * d_y
+                    if distance < best_distance or \
+                       (distance == best_distance and i < best):
+                        best, best_distance = i, distance
+            if best_distance < (k * self.cell_size) ** 2:
+                break
+        return best
 
 class cylindrical_slicer:
     def __init__(self, stl_file_address:str, nozzle_diameter:float, 
@@ -36,112 +142,349 @@ class cylindrical_slicer:
         #Error threshold
         self.epsilon = 0.000001
         
-        #Triangles that make up the model
-        self.triangles = np.float64(model.points)
-        num_triangles = len(self.triangles)
-        
-        #row indices
-        self.rows = np.split(np.repeat(np.arange(num_triangles), 3), num_triangles)
-        
-        #Columns indices
-        self.x_columns = np.array([np.arange(0, 9, 3),] * num_triangles)
-        self.y_columns = np.array([np.arange(1, 9, 3),] * num_triangles)
-        self.z_columns = np.array([np.arange(2, 9, 3),] * num_triangles)
+        #Triangles that make up the model as they are in the STL file, an
+        #(N, 3, 3) array of the x, y and z of the three vertices of each 
+        #triangle. The x, y and z of all vertices are the strided views
+        #triangles[:, :, 0], triangles[:, :, 1] and triangles[:, :, 2]
+        self.pristine = np.float64(model.points).reshape(-1, 3, 3)
         
         #Center
-        self.center_x = np.sum(self.triangles[self.rows, self.x_columns]) / \
-                        np.size(self.triangles[self.rows, self.x_columns])
-        self.center_y = np.sum(self.triangles[self.rows, self.y_columns]) / \
-                        np.size(self.triangles[self.rows, self.y_columns])
-        self.center_z = np.sum(self.triangles[self.rows, self.z_columns]) / \
-                        np.size(self.triangles[self.rows, self.z_columns])
+        vertices = self.pristine.reshape(-1, 3)
+        self.center_x, self.center_y, self.center_z = vertices.mean(axis = 0)
                         
-        #Locations
-        self.location_x = location_x
-        self.location_y = location_y
-        self.location_z = location_z
-        
-        #Locations
-        self.rotation_x = rotation_x
-        self.rotation_y = rotation_y
-        self.rotation_z = rotation_z
-        
-        #Rotate model
-        self.rotate()
-        
-        #translate model
-        self.translate()
-        
-        #Get the distance each point is away from the x-axis
-        y_squared = np.power(self.triangles[self.rows, self.y_columns], 2)
-        z_squared = np.power(self.triangles[self.rows, self.z_columns], 2)
-        self.radii = np.sqrt(np.add(y_squared, z_squared))
-        self.max_radius = np.amax(self.radii)
+        #Normal of each triangle of the STL file given by the order of its 
+        #vertices
+        self.pristine_normals = np.cross(self.pristine[:, 1] - self.pristine[:, 0], 
+                                         self.pristine[:, 2] - self.pristine[:, 0])
         
         #Other parameters
         self.delta_y = delta_y
         self.cylinder_diameter = cylinder_diameter
         self.nozzle_diameter = nozzle_diameter 
         
-        #Groups of triangles and radii
-        self.tri_case_1 = np.array([])
-        self.tri_case_2 = np.array([])
-        self.tri_case_3 = np.array([])
-        self.tri_case_4 = np.array([])
+        #Groups of triangles and the radii and vertices the case kernels 
+        #use (see sort_triangles)
+        self.index_case_1 = np.array([], dtype = np.int64)
+        self.index_case_2 = np.array([], dtype = np.int64)
+        self.index_case_3 = np.array([], dtype = np.int64)
+        self.index_case_4 = np.array([], dtype = np.int64)
+        self.index_case_5 = np.array([], dtype = np.int64)
+        self.index_case_6 = np.array([], dtype = np.int64)
+        
         self.tri_case_5 = np.array([])
         self.tri_case_6 = np.array([])
         
         self.radii_case_1 = np.array([])
         self.radii_case_2 = np.array([])
-        self.radii_case_3 = np.array([])
-        self.radii_case_4 = np.array([])
         self.radii_case_5 = np.array([])
         self.radii_case_6 = np.array([])
         
-    def rotate(self) -> None: 
+        #Buffer of the loop being stitched, reused by every loop
+        self.loop_buffer = growable_array(6)
+        
+        #End points of the edges that could not be joined into a loop
+        self.unmatched_endpoints = np.empty((0, 2))
+        
+        #Loops of the last layer and their signed areas (see islands)
+        self.loops = []
+        self.loop_areas = np.empty(0)
+
+        #Walls of the last layer that did not fit inside the mesh
+        self.collapsed_walls = 0
+
+        #Shared memory blocks backing the mesh arrays (see share_memory)
+        self.shared_blocks = []
+        self.shared_spec = dict()
+        self.shared_owner = False
+        
+        #Rotate and translate the model, then compute the radii, normals 
+        #and edge tables of the transformed model
+        self.rotation_x = self.rotation_y = self.rotation_z = None
+        self.set_transform(rotation_x, rotation_y, rotation_z, 
+                           location_x, location_y, location_z)
+        
+    #Arrays that do not change once the mesh is transformed
+    shared_arrays = ("pristine", "pristine_normals", "triangles", "radii", "sorted_radii", "normals", 
+                     "edge_a", "edge_b", "edge_c", "edge_discriminant", 
+                     "edge_t", "edge_radii", "lower_radii", "upper_radii", 
+                     "lower_order", "upper_order", 
+                     "sorted_lower_radii", "sorted_upper_radii")
+    
+    def share_memory(self) -> dict:
+        """
+        Moves the arrays of the transformed mesh into shared memory blocks
+        and returns the name, shape and type of the block of every array. 
+        Once shared, a pickled copy of the slicer (sent to a worker 
+        process) only holds the names of the blocks and attaches to them 
+        read-only when it is unpickled, so the mesh is not copied into 
+        every worker. release_memory must be called when the workers are 
+        done.
+        """
+        if len(self.shared_spec) != 0:
+            return self.shared_spec
+        for name in self.shared_arrays:
+            array = getattr(self, name)
+            block = shared_memory.SharedMemory(create = True, 
+                                               size = max(array.nbytes, 1))
+            shared = np.ndarray(array.shape, dtype = array.dtype, 
+                                buffer = block.buf)
+            shared[...] = array
+            setattr(self, name, shared)
+            self.shared_blocks += [block]
+            self.shared_spec[name] = (block.name, array.shape, array.dtype.str)
+        self.shared_owner = True
+        return self.shared_spec
+    
+    def attach_memory(self, spec:dict) -> None:
+        """
+        Attaches to the shared memory blocks created by share_memory in 
+        another process. The arrays are read-only views of the blocks.
+        """
+        self.shared_blocks = []
+        for name, (block_name, shape, dtype) in spec.items():
+            block = shared_memory.SharedMemory(name = block_name)
+            shared = np.ndarray(shape, dtype = dtype, buffer = block.buf)
+            shared.setflags(write = False)
+            setattr(self, name, shared)
+            self.shared_blocks += [block]
+        self.shared_spec = spec
+        self.shared_owner = False
+    
+    def release_memory(self) -> None:
+        """
+        Copies the shared arrays back into the memory of this process and 
+        frees the shared memory blocks.
+        """
+        for name in self.shared_spec:
+            setattr(self, name, np.array(getattr(self, name)))
+        for block in self.shared_blocks:
+            block.close()
+            if self.shared_owner:
+                block.unlink()
+        self.shared_blocks = []
+        self.shared_spec = dict()
+        self.shared_owner = False
+    
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        if len(self.shared_spec) != 0:
+            for name in self.shared_spec:
+                del state[name]
+            state["shared_blocks"] = []
+        return state
+    
+    def __setstate__(self, state:dict) -> None:
+        self.__dict__.update(state)
+        if len(self.shared_spec) != 0:
+            self.attach_memory(self.shared_spec)
+    
+    def transform_matrix(self) -> (np.ndarray, np.ndarray):
+        """
+        Returns the rotation matrix R and the offset of the transform of 
+        the model. The model is rotated about its center c, first about the
+        x-axis, then the y-axis, then the z-axis, and then translated by 
+        the location l:
+            R = R_z * R_y * R_x
+            p' = R * (p - c) + c + l = R * p + offset
+            offset = c - R * c + l
+        """
         #Convert to radians
         theta_x = self.rotation_x * np.pi / 180
         theta_y = self.rotation_y * np.pi / 180
         theta_z = self.rotation_z * np.pi / 180
         
-        #Translate model to origin
-        self.triangles[self.rows, self.x_columns] -= self.center_x
-        self.triangles[self.rows, self.y_columns] -= self.center_y
-        self.triangles[self.rows, self.z_columns] -= self.center_z
-        
-        #Rotate model x-axis
-        y = self.triangles[self.rows, self.y_columns]
-        z = self.triangles[self.rows, self.z_columns]      
-        self.triangles[self.rows, self.y_columns] = y * np.cos(theta_x) - \
-                                                    z * np.sin(theta_x)
-        self.triangles[self.rows, self.z_columns] = y * np.sin(theta_x) + \
-                                                    z * np.cos(theta_x)
-        #Rotate model y-axis
-        x = self.triangles[self.rows, self.x_columns]
-        z = self.triangles[self.rows, self.z_columns]      
-        self.triangles[self.rows, self.x_columns] = x * np.cos(theta_y) + \
-                                                    z * np.sin(theta_y)
-        self.triangles[self.rows, self.z_columns] = z * np.cos(theta_y) - \
-                                                    x * np.sin(theta_y)
-        #Rotate model z-axis
-        x = self.triangles[self.rows, self.x_columns]
-        y = self.triangles[self.rows, self.y_columns]      
-        self.triangles[self.rows, self.x_columns] = x * np.cos(theta_z) - \
-                                                    y * np.sin(theta_z)
-        self.triangles[self.rows, self.y_columns] = x * np.sin(theta_z) + \
-                                                    y * np.cos(theta_z)
-        
-        #Translate model back to original position
-        self.triangles[self.rows, self.x_columns] += self.center_x
-        self.triangles[self.rows, self.y_columns] += self.center_y
-        self.triangles[self.rows, self.z_columns] += self.center_z
+        rotation_x = np.array([[1, 0, 0],
+                               [0, np.cos(theta_x), -np.sin(theta_x)],
+                               [0, np.sin(theta_x), np.cos(theta_x)]])
+        rotation_y = np.array([[np.cos(theta_y), 0, np.sin(theta_y)],
+                               [0, 1, 0],
+                               [-np.sin(theta_y), 0, np.cos(theta_y)]])
+        rotation_z = np.array([[np.cos(theta_z), -np.sin(theta_z), 0],
+                               [np.sin(theta_z), np.cos(theta_z), 0],
+                               [0, 0, 1]])
+        R = rotation_z @ rotation_y @ rotation_x
+        
+        center = np.array([self.center_x, self.center_y, self.center_z])
+        location = np.array([self.location_x, self.location_y, self.location_z])
+        offset = center - R @ center + location
+        return R, offset
     
-    def translate(self) -> None:
-        self.triangles[self.rows, self.x_columns] += self.location_x
-        self.triangles[self.rows, self.y_columns] += self.location_y
-        self.triangles[self.rows, self.z_columns] += self.location_z
+    def set_transform(self, rotation_x:float, rotation_y:float, 
+                      rotation_z:float, location_x:float, location_y:float, 
+                      location_z:float) -> None:
+        """
+        Rotates and translates the model (see transform_matrix) from the 
+        triangles of the STL file in one matrix product, so the STL file 
+        does not need to be loaded again and the errors of consecutive 
+        rotations do not add up. When only the location changed the 
+        triangles are moved by the change in location instead:
+            p' = p + (l_new - l_old)
+        Only the arrays that depend on the transform are recomputed: the 
+        radii, normals and the edge and interval tables.
+        """
+        #The arrays are replaced so they can no longer be shared
+        if len(self.shared_spec) != 0:
+            self.release_memory()
+        rotated = (self.rotation_x, self.rotation_y, self.rotation_z) != \
+                  (rotation_x, rotation_y, rotation_z)
+        if not rotated:
+            shift = np.array([location_x - self.location_x, 
+                              location_y - self.location_y, 
+                              location_z - self.location_z])
+        self.rotation_x = rotation_x
+        self.rotation_y = rotation_y
+        self.rotation_z = rotation_z
+        self.location_x = location_x
+        self.location_y = location_y
+        self.location_z = location_z
         
-    def sort_triangles(self, r:float) -> None:
+        if rotated:
+            R, offset = self.transform_matrix()
+            vertices = self.pristine.reshape(-1, 3) @ R.T + offset
+            self.triangles = vertices.reshape(-1, 3, 3)
+            self.normals = self.pristine_normals @ R.T
+        else:
+            self.triangles = self.triangles + shift
+        
+        #Get the distance each point is away from the x-axis
+        self.radii = np.hypot(self.triangles[:, :, 1], self.triangles[:, :, 2])
+        self.max_radius = np.amax(self.radii)
+        
+        #Radii of each triangle sorted from closest to furthest from the x-axis
+        self.sorted_radii = np.sort(self.radii, axis = 1)
+        
+        #Geometry of each edge that does not depend on the slicing radius
+        self.build_edge_table()
+        
+        #Radial interval of each triangle sorted for quick lookup
+        self.build_interval_index()
+        
+    def build_edge_table(self) -> None:
+        """
+        Stores the geometry of the three edges of every triangle that does
+        not depend on the radius of the slicing cylinder as (N, 3) arrays.
+        Edge k of a triangle goes from vertex k to vertex k + 1 (edge 2 
+        goes from the third vertex back to the first):
+            v_o = vertex k
+            v = vertex k - vertex k + 1
+        
+        Coefficients of the quadratic equation (see edge_intersections):
+            edge_a = (v_y)^2 + (v_z)^2
+            edge_b = 2 * (y_o * v_y + z_o * v_z)
+            edge_c = (y_o)^2 + (z_o)^2 
+            edge_discriminant = (edge_b)^2 - 4 * edge_a * edge_c
+        so that for a radius r:
+            c = edge_c - r^2
+            b^2 - 4ac = edge_discriminant + 4 * edge_a * r^2
+            
+        Closest point to the x-axis, where the distance from the x-axis
+            d(t) = sqrt((y_o + v_y*t)^2 + (z_o + v_z*t)^2)
+        has d'(t) = 0:
+            edge_t = -(v_y * y_o + v_z * z_o) / ((v_y)^2 +(v_z)^2)
+            edge_radii = shortest distance between the edge and the x-axis
+                         or 0 if the closest point does not fit within 
+                         the bounds of the edge
+        """
+        v_o = self.triangles
+        v_e = np.roll(self.triangles, -1, axis = 1)
+        v = v_o - v_e
+        y_o, z_o = v_o[:, :, 1], v_o[:, :, 2]
+        v_y, v_z = v[:, :, 1], v[:, :, 2]
+        
+        self.edge_a = v_y ** 2 + v_z ** 2
+        self.edge_b = 2 * (y_o * v_y + z_o * v_z)
+        self.edge_c = y_o ** 2 + z_o ** 2
+        self.edge_discriminant = self.edge_b ** 2 - 4 * self.edge_a * self.edge_c
+        
+        degenerate = (abs(v_y) < self.epsilon) & (abs(v_z) < self.epsilon)
+        a = np.where(degenerate, 1, self.edge_a)
+        self.edge_t = np.where(degenerate, 0, -(y_o * v_y + z_o * v_z) / a)
+        closest = v_o + self.edge_t[:, :, np.newaxis] * v
+        lower = np.minimum(v_o, v_e) - self.epsilon
+        upper = np.maximum(v_o, v_e) + self.epsilon
+        in_bounds = np.all((lower < closest) & (closest < upper), axis = 2)
+        in_bounds &= ~degenerate
+        closest_radii = np.sqrt(closest[:, :, 1] ** 2 + closest[:, :, 2] ** 2)
+        self.edge_radii = np.where(in_bounds, closest_radii, 0)
+    
+    def build_interval_index(self) -> None:
+        """
+        A triangle can only be intersected by a cylinder with a radius in 
+        between the closest point of its edges to the x-axis and its 
+        furthest vertex. The closest point of an edge can be inside all 
+        three vertices (Case 3) and is read from the edge table. If it 
+        does not fit within the bounds of the edge the closest point is a 
+        vertex. 
+        
+        The lower and upper bound of every triangle are sorted once so the 
+        triangles that straddle a radius can be found with a binary search.
+        """
+        edge_radii = np.where(self.edge_radii > 0, self.edge_radii, np.inf)
+        self.lower_radii = np.minimum(np.amin(edge_radii, axis = 1), 
+                                      self.sorted_radii[:, 0])
+        self.upper_radii = self.sorted_radii[:, 2]
+        self.lower_order = np.argsort(self.lower_radii, kind = "stable")
+        self.upper_order = np.argsort(self.upper_radii, kind = "stable")
+        self.sorted_lower_radii = self.lower_radii[self.lower_order]
+        self.sorted_upper_radii = self.upper_radii[self.upper_order]
+    
+    def active_triangles(self, r:float) -> np.ndarray:
+        """
+        Returns the sorted indices of the triangles with
+            lower radius <= r < upper radius
+        Only the smaller of the two groups found by the binary searches 
+        is checked against the other bound.
+        """
+        num_entered = np.searchsorted(self.sorted_lower_radii, r, 
+                                      side = "right")
+        num_exited = np.searchsorted(self.sorted_upper_radii, r, 
+                                     side = "right")
+        if num_entered <= len(self.triangles) - num_exited:
+            candidates = self.lower_order[:num_entered]
+            active = candidates[self.upper_radii[candidates] > r]
+        else:
+            candidates = self.upper_order[num_exited:]
+            active = candidates[self.lower_radii[candidates] <= r]
+        return np.sort(active)
+    
+    def sweep_edges(self, radii:np.ndarray) -> Iterator[tuple]:
+        """
+        Generator that yields (r, edges) for every radius in "radii". The 
+        radii must be in increasing order.
+        
+        Instead of searching for the active triangles of every layer from 
+        scratch, the cylinder is swept outwards through two event queues:
+            enter events: lower radii of the triangles in increasing order
+            exit events: upper radii of the triangles in increasing order
+        When the radius grows past an enter event the triangle is added to 
+        the active set and when it grows past an exit event the triangle 
+        is removed. Each triangle enters and exits once.
+        """
+        is_active = np.zeros(len(self.triangles), dtype = bool)
+        active = np.array([], dtype = np.int64)
+        num_entered = 0
+        num_exited = 0
+        for r in radii:
+            #Triangles with lower radius <= r
+            next_num_entered = np.searchsorted(self.sorted_lower_radii, r, 
+                                               side = "right")
+            entered = self.lower_order[num_entered:next_num_entered]
+            is_active[entered] = True
+            num_entered = next_num_entered
+            
+            #Triangles with upper radius <= r
+            next_num_exited = np.searchsorted(self.sorted_upper_radii, r, 
+                                              side = "right")
+            exited = self.upper_order[num_exited:next_num_exited]
+            is_active[exited] = False
+            num_exited = next_num_exited
+            
+            if len(entered) != 0 or len(exited) != 0:
+                active = np.concatenate((active, entered))
+                active = np.sort(active[is_active[active]])
+            yield r, self.gather_edges(r, active)
+        
+    def sort_triangles(self, r:float, active:np.ndarray = None) -> None:
         """
         Slicing cylinder with its axis along the x-axis that has a radius "r".
         The cylinder will intersect with a triangle given as
@@ -240,856 +583,472 @@ class cylindrical_slicer:
             - 2 intersection points (1 vertex included)
             (tangent and vertex intersections omitted)
         """
-        #Find the point on each triangle that is furthest from the x-axis
-        max_radii = np.array([np.amax(self.radii, axis = 1)])
-        #Find the point on each triangle that is in between or equal to the 
-        #other two points
-        mid_radii = np.array([np.median(self.radii, axis = 1)])
-        #Find the point on each triangle that is closest to the x-axis
-        min_radii =  np.array([np.amin(self.radii, axis = 1)])
-
-        #greater_than_max = np.where(max_radii < r)
-        greater_than_mid = np.where(mid_radii < r)
-        greater_than_min = np.where(min_radii < r)
-    
-        less_than_max = np.where(max_radii > r)
-        less_than_mid = np.where(mid_radii > r)
-        less_than_min = np.where(min_radii > r)
-        
-        #equal_to_max = np.where(max_radii == r)
-        equal_to_mid = np.where(mid_radii == r)
-        equal_to_min = np.where(min_radii == r)
-        
-        #index_case_0 is not needed
-        index_case_1 = np.concatenate((less_than_max[1],
-                                       greater_than_mid[1],
-                                       greater_than_min[1]), axis=0)
-        index_case_2 = np.concatenate((less_than_max[1],
-                                       less_than_mid[1],
-                                       greater_than_min[1]), axis=0)
-        index_case_3 = np.concatenate((less_than_max[1],
-                                       less_than_mid[1],
-                                       less_than_min[1]), axis=0)
-        index_case_4 = np.concatenate((less_than_max[1],
-                                       less_than_mid[1],
-                                       equal_to_min[1]), axis=0)
-        index_case_5 = np.concatenate((less_than_max[1],
-                                       greater_than_min[1],
-                                       equal_to_mid[1]), axis=0)
-        index_case_6 = np.concatenate((less_than_max[1],
-                                       equal_to_mid[1],
-                                       equal_to_min[1]), axis=0)
+        if active is None:
+            active = self.active_triangles(r)
+        labels = self.classify_triangles(r, active)
+        
         #Group triangles based on case
-        cases = (index_case_1, index_case_2, index_case_3, 
-                 index_case_4, index_case_5, index_case_6)
-        for i in range(len(cases)):
-            elements, count = np.unique(cases[i], return_counts = True)
-            duplicates = elements[count > 2]
-            if i == 0:
-                self.tri_case_1 = self.triangles[duplicates, :]
-                self.radii_case_1 = self.radii[duplicates, :]
-            elif i == 1:
-                self.tri_case_2 = self.triangles[duplicates, :]
-                self.radii_case_2 = self.radii[duplicates, :]
-            elif i == 2:
-                self.tri_case_3 = self.triangles[duplicates, :]
-                self.radii_case_3 = self.radii[duplicates, :]
-            elif i == 3:
-                self.tri_case_4 = self.triangles[duplicates, :]
-                self.radii_case_4 = self.radii[duplicates, :]
-            elif i == 4:
-                self.tri_case_5 = self.triangles[duplicates, :]
-                self.radii_case_5 = self.radii[duplicates, :]
-            elif i == 5:
-                self.tri_case_6 = self.triangles[duplicates, :]
-                self.radii_case_6 = self.radii[duplicates, :]
+        self.index_case_1 = active[labels == 1]
+        self.index_case_2 = active[labels == 2]
+        self.index_case_3 = active[labels == 3]
+        self.index_case_4 = active[labels == 4]
+        self.index_case_5 = active[labels == 5]
+        self.index_case_6 = active[labels == 6]
+        
+        self.tri_case_5 = self.triangles[self.index_case_5]
+        self.tri_case_6 = self.triangles[self.index_case_6]
+        
+        self.radii_case_1 = self.radii[self.index_case_1]
+        self.radii_case_2 = self.radii[self.index_case_2]
+        self.radii_case_5 = self.radii[self.index_case_5]
+        self.radii_case_6 = self.radii[self.index_case_6]
     
-    def gather_edges(self, r:float) -> np.ndarray:
-        #Reset triangle groups and radii groups
-        self.tri_case_1 = np.array([])
-        self.tri_case_2 = np.array([])
-        self.tri_case_3 = np.array([])
-        self.tri_case_4 = np.array([])
-        self.tri_case_5 = np.array([])
-        self.tri_case_6 = np.array([])
+    def classify_triangles(self, r:float, 
+                           index:np.ndarray = slice(None)) -> np.ndarray:
+        """
+        Returns the case label (0 - 6) of the triangles selected by "index"
+        for the slicing cylinder of radius "r". See sort_triangles for the 
+        definition of each case.
         
-        self.radii_case_1 = np.array([])
-        self.radii_case_2 = np.array([])
-        self.radii_case_3 = np.array([])
-        self.radii_case_4 = np.array([])
-        self.radii_case_5 = np.array([])
-        self.radii_case_6 = np.array([])
+        The closest, middle and furthest vertex of each triangle are 
+        compared with r only once. Each comparison is stored as a state:
+            state = sign(r_vertex - r) + 1
+            0: r_vertex < r
+            1: r_vertex == r
+            2: r_vertex > r
+        The states of the closest and middle vertex form an index into a
+        lookup table of cases. Triangles with their furthest vertex on or
+        inside the cylinder are always case 0.
+        """
+        sorted_radii = self.sorted_radii[index]
+        min_radii = sorted_radii[:, 0]
+        mid_radii = sorted_radii[:, 1]
+        max_radii = sorted_radii[:, 2]
+        
+        #Lookup table indexed by 3 * mid_state + min_state 
+        case_table = np.array([1, 0, 0, 5, 6, 0, 2, 4, 3], dtype = np.int8)
         
+        mid_state = np.sign(mid_radii - r).astype(np.int8) + 1
+        min_state = np.sign(min_radii - r).astype(np.int8) + 1
+        labels = case_table[3 * mid_state + min_state]
+        labels[max_radii <= r] = 0
+        return labels
+    
+    def gather_edges(self, r:float, active:np.ndarray = None) -> np.ndarray:
         #Sort triangles into groups
-        self.sort_triangles(r)
-        
-        """
-        print("case:1", self.tri_case_1)
-        print(self.radii_case_1)
-        print("case:2", self.tri_case_2)
-        print(self.radii_case_2)
-        print("case:3", self.tri_case_3)
-        print(self.radii_case_3)
-        print("case:4", self.tri_case_4)
-        print(self.radii_case_4)
-        print("case:5", self.tri_case_5)
-        print(self.radii_case_5)
-        print("case:6", self.tri_case_6)
-        print(self.radii_case_6)
-        """
-        
-        first_case = True
-        if len(self.tri_case_1) != 0:
-            edges_case_1 = self.case_1(r)
-            edges = edges_case_1
-            first_case = False
-            
-        if len(self.tri_case_2) != 0:
-            edges_case_2 = self.case_2(r)
-            if not(first_case):
-                edges = np.append(edges, edges_case_2, axis = 0)
-            else:
-                edges = edges_case_2
-                first_case = False    
-                
-        if len(self.tri_case_3) != 0:
-            edges_case_3 = self.case_3(r)
-            if len(edges_case_3) != 0:
-                if not(first_case):
-                    edges = np.append(edges, edges_case_3, axis = 0)
-                else:
-                    edges = edges_case_3
-                    first_case = False    
-                
-        if len(self.tri_case_4) != 0:
-            edges_case_4 = self.case_4(r)
-            if len(edges_case_4) != 0:
-                if not(first_case):
-                    edges = np.append(edges, edges_case_4, axis = 0)
-                else:
-                    edges = edges_case_4
-                    first_case = False    
-                
-        if len(self.tri_case_5) != 0:
-            edges_case_5 = self.case_5(r)
-            if len(edges_case_5) != 0:
-                if not(first_case):
-                    edges = np.append(edges, edges_case_5, axis = 0)
-                else:
-                    edges = edges_case_5
-                    first_case = False    
-                
-        if len(self.tri_case_6) != 0:
-            edges_case_6 = self.case_6(r)
-            if len(edges_case_6) != 0:
-                if not(first_case):
-                    edges = np.append(edges, edges_case_6, axis = 0)
-                else:
-                    edges = edges_case_6
-                    first_case = False  
-        if first_case:
+        self.sort_triangles(r, active)
+        
+        """
+        Every case kernel returns the number of edges formed by each of its
+        triangles (0 - 3) and an array of shape (triangles, 3, 6) holding 
+        those edges. The edges are written into one preallocated array in 
+        the order of the cases and triangles.
+        """
+        kernels = ((self.index_case_1, self.case_1),
+                   (self.index_case_2, self.case_2),
+                   (self.index_case_3, self.case_3),
+                   (self.index_case_4, self.case_4),
+                   (self.index_case_5, self.case_5),
+                   (self.index_case_6, self.case_6))
+        results = []
+        num_edges = 0
+        for triangles, kernel in kernels:
+            if len(triangles) != 0:
+                counts, case_edges = kernel(r)
+                results += [(triangles, counts, case_edges)]
+                num_edges += np.sum(counts)
+        if num_edges == 0:
             return "error"
-        else:
-            edges = self.reconstruct_edges(r, edges)
-            return edges
-    
-    def case_1(self, r:float) -> np.ndarray:
-        #print("case 1")
-        for i in range(len(self.tri_case_1)):
-            r_1 = self.radii_case_1[i][0]
-            r_2 = self.radii_case_1[i][1]
-            r_3 = self.radii_case_1[i][2]
-            if (r_1 < r > r_2):
-                edge_1 = np.append(self.tri_case_1[i][3:6], 
-                                  self.tri_case_1[i][6:])
-                edge_2 = np.append(self.tri_case_1[i][:3], 
-                                  self.tri_case_1[i][6:])
-            elif (r_2 < r > r_3):
-                edge_1 = np.append(self.tri_case_1[i][6:], 
-                                  self.tri_case_1[i][:3])
-                edge_2 = np.append(self.tri_case_1[i][3:6], 
-                                  self.tri_case_1[i][:3])
-            elif (r_1 < r > r_3):
-                edge_1 = np.append(self.tri_case_1[i][:3], 
-                                  self.tri_case_1[i][3:6])
-                edge_2 = np.append(self.tri_case_1[i][6:], 
-                                  self.tri_case_1[i][3:6])            
-            
-            point_a, point_b = self.find_intersection(r, edge_1)
-            point_c, point_d = self.find_intersection(r, edge_2)
-            
-            if len(point_a) != 0:
-                point_1 = point_a
-            else:
-                point_1 = point_b
-            if len(point_c) != 0:
-                point_2 = point_c
-            else:
-                point_2 = point_d
-                
-            form_edge = np.append(point_1, point_2)
-            unwrapped_edge = self.unwrap(r, form_edge)
-            
-            if i == 0:
-                edges = np.array([unwrapped_edge])   
-            else:
-                edges = np.append(edges, np.array([unwrapped_edge]), axis = 0)
-        return edges
-            
-    def case_2(self, r:float) -> np.ndarray:
-        #print("case 2")
-        for i in range(len(self.tri_case_2)):
-            r_1 = self.radii_case_2[i][0]
-            r_2 = self.radii_case_2[i][1]
-            r_3 = self.radii_case_2[i][2]
-            if r > r_1:
-                opposite_edge = np.append(self.tri_case_2[i][3:6], 
-                                          self.tri_case_2[i][6:])
-                edge_1 = np.append(self.tri_case_2[i][:3], 
-                                  self.tri_case_2[i][3:6])
-                edge_2 = np.append(self.tri_case_2[i][:3], 
-                                  self.tri_case_2[i][6:])          
-            elif r > r_2 :
-                opposite_edge = np.append(self.tri_case_2[i][:3], 
-                                          self.tri_case_2[i][6:])
-                edge_1 = np.append(self.tri_case_2[i][:3], 
-                                  self.tri_case_2[i][3:6])
-                edge_2 = np.append(self.tri_case_2[i][6:], 
-                                  self.tri_case_2[i][3:6])        
-            elif r > r_3:
-                opposite_edge = np.append(self.tri_case_2[i][:3], 
-                                          self.tri_case_2[i][3:6])
-                edge_1 = np.append(self.tri_case_2[i][3:6], 
-                                  self.tri_case_2[i][6:])
-                edge_2 = np.append(self.tri_case_2[i][:3], 
-                                  self.tri_case_2[i][6:])
-                
-            d = self.shortest_distance(opposite_edge)
-            
-            if r < d or d == 0:
-                #print("case 2.1")
-                point_a, point_b = self.find_intersection(r, edge_1)
-                point_c, point_d = self.find_intersection(r, edge_2)
-                if len(point_a) != 0:
-                    point_1 = point_a
-                else:
-                    point_1 = point_b
-                if len(point_c) != 0:
-                    point_2 = point_c
-                else:
-                    point_2 = point_d
-                    
-                form_edge = np.append(point_1, point_2)
-                unwrapped_edge = self.unwrap(r, form_edge)
-                
-                if i == 0:
-                    edges = np.array([unwrapped_edge])   
-                else:
-                    edges = np.append(edges, np.array([unwrapped_edge]), axis = 0)
-            
-            elif r > d != 0: 
-                #print("case 2.2")
-                point_a, point_b = self.find_intersection(r, edge_1)
-                point_c, point_d = self.find_intersection(r, edge_2)
-                point_e, point_f = self.find_intersection(r, opposite_edge)
-
-                if len(point_a) != 0:
-                    point_1 = point_a
-                else:
-                    point_1 = point_b
-                if len(point_c) != 0:
-                    point_2 = point_c
-                else:
-                    point_2 = point_d
-                
-                l_1e = self.point_distance(point_1, point_e)
-                l_1f = self.point_distance(point_1, point_f)
-                
-                l_2e = self.point_distance(point_2, point_e)
-                l_2f = self.point_distance(point_2, point_f)
-                
-                if l_1e < l_1f:
-                    if l_1e < l_2e:
-                        form_edge_1 = np.append(point_1, point_e)
-                        form_edge_2 = np.append(point_2, point_f)
-                    else:
-                        form_edge_1 = np.append(point_1, point_f)
-                        form_edge_2 = np.append(point_2, point_e)
-                else:
-                    if l_1f < l_2f:
-                        form_edge_1 = np.append(point_1, point_f)
-                        form_edge_2 = np.append(point_2, point_e)
-                    else:
-                        form_edge_1 = np.append(point_1, point_e)
-                        form_edge_2 = np.append(point_2, point_f)
-                
-                unwrapped_edge_1 = self.unwrap(r, form_edge_1)
-                unwrapped_edge_2 = self.unwrap(r, form_edge_2)
-                
-                if i != 0:
-                    edges = np.append(edges, np.array([unwrapped_edge_1]), 
-                                      axis = 0)
-                    edges = np.append(edges, np.array([unwrapped_edge_2]), 
-                                      axis = 0)
-                else:
-                    edges = np.array([unwrapped_edge_1])
-                    edges = np.append(edges, np.array([unwrapped_edge_2]), 
-                                      axis = 0)
+        
+        edges = np.empty((num_edges, 6))
+        edge_triangles = np.empty(num_edges, dtype = np.int64)
+        start = 0
+        for triangles, counts, case_edges in results:
+            filled = np.arange(3) < counts[:, np.newaxis]
+            end = start + np.sum(counts)
+            edges[start:end] = case_edges[filled]
+            edge_triangles[start:end] = np.repeat(triangles, counts)
+            start = end
+        edges = self.orient_edges(edges, edge_triangles)
+        edges = self.unwrap_edges(r, edges)
+        edges = self.reconstruct_edges(r, edges)
         return edges
     
-    def case_3(self, r:float) -> np.ndarray:
-        #print("case 3")
-        first_pass = True
-        for i in range(len(self.tri_case_3)):
-            edge_1 = np.append(self.tri_case_3[i][3:6], 
-                               self.tri_case_3[i][6:])
-            edge_2 = np.append(self.tri_case_3[i][:3], 
-                               self.tri_case_3[i][3:6])
-            edge_3 = np.append(self.tri_case_3[i][:3], 
-                               self.tri_case_3[i][6:])      
-            d_1 = self.shortest_distance(edge_1)
-            d_2 = self.shortest_distance(edge_2)
-            d_3 = self.shortest_distance(edge_3)
-            
-            triangle_edges = np.array([edge_1, edge_2, edge_3])
-            distances = np.array([d_1, d_2, d_3])
-            
-            greater_than_zero = np.where(distances > self.epsilon)
-            less_than_radius = np.where(distances < r)
-            
-            index = np.concatenate((greater_than_zero[0],
-                                    less_than_radius[0]), axis=0)
-            
-            elements, count = np.unique(index, return_counts = True)
-            duplicates = elements[count > 1]
-            if len(duplicates) == 0:
-                #print("case 3.1")
-                continue
-            
-            elif len(duplicates) == 1:
-                #print("case 3.2")
-                intersecting_edge = triangle_edges[duplicates[0]]
-                point_1, point_2 = self.find_intersection(r, intersecting_edge)
-                form_edge = np.append(point_1, point_2)
-                unwrapped_edge = self.unwrap(r, form_edge)
-                
-                if first_pass:
-                    edges = np.array([unwrapped_edge])
-                    first_pass = False
-                else:
-                    edges = np.append(edges, np.array([unwrapped_edge]), axis = 0)
-                    
-                    
-            elif len(duplicates) == 2:
-                #print("case 3.3")
-                intersecting_edge_1 = triangle_edges[duplicates[0]]
-                intersecting_edge_2 = triangle_edges[duplicates[1]]
-                
-                point_a, point_b = self.find_intersection(r, intersecting_edge_1)
-                point_c, point_d = self.find_intersection(r, intersecting_edge_2)
-                
-                l_ac = self.point_distance(point_a, point_c)
-                l_ad = self.point_distance(point_a, point_d)
-                
-                l_bc = self.point_distance(point_b, point_c)
-                l_bd = self.point_distance(point_b, point_d)
-                
-                if l_ac < l_ad:
-                    if l_ac < l_bc:
-                        form_edge_1 = np.append(point_a, point_c)
-                        form_edge_2 = np.append(point_b, point_d)
-                    else:
-                        form_edge_1 = np.append(point_a, point_d)
-                        form_edge_2 = np.append(point_b, point_c)
-                else:
-                    if l_ad < l_bd:
-                        form_edge_1 = np.append(point_a, point_d)
-                        form_edge_2 = np.append(point_b, point_c)
-                    else:
-                        form_edge_1 = np.append(point_a, point_c)
-                        form_edge_2 = np.append(point_b, point_d)
-                
-                unwrapped_edge_1 = self.unwrap(r, form_edge_1)
-                unwrapped_edge_2 = self.unwrap(r, form_edge_2)
-                
-                if not(first_pass):
-                    edges = np.append(edges, np.array([unwrapped_edge_1]), 
-                                      axis = 0)
-                    edges = np.append(edges, np.array([unwrapped_edge_2]), 
-                                      axis = 0)
-                else:
-                    edges = np.array([unwrapped_edge_1])
-                    edges = np.append(edges, np.array([unwrapped_edge_2]), 
-                                      axis = 0)
-                    first_pass = False
-                    
-            elif len(duplicates) == 3:
-                #print("case 3.4")
-                intersecting_edge_1 = triangle_edges[duplicates[0]]
-                intersecting_edge_2 = triangle_edges[duplicates[1]]
-                intersecting_edge_3 = triangle_edges[duplicates[2]]
-                
-                point_a, point_b = self.find_intersection(r, intersecting_edge_1)
-                point_c, point_d = self.find_intersection(r, intersecting_edge_2)
-                point_e, point_f = self.find_intersection(r, intersecting_edge_3)
-                
-                l_ac = self.point_distance(point_a, point_c)
-                l_ad = self.point_distance(point_a, point_d)
-                l_ae = self.point_distance(point_a, point_e)
-                l_af = self.point_distance(point_a, point_f)
-                
-                l_bc = self.point_distance(point_b, point_c)
-                l_bd = self.point_distance(point_b, point_d)
-                l_be = self.point_distance(point_b, point_e)
-                l_bf = self.point_distance(point_b, point_f)
-                
-                if l_ac < l_ad:
-                    if l_ac < l_bc:
-                        form_edge_1 = np.append(point_a, point_c)
-                        if l_be < l_bf:
-                            form_edge_2  = np.append(point_b, point_e)
-                            form_edge_3  = np.append(point_f, point_d)
-                        else:
-                            form_edge_2  = np.append(point_b, point_f)
-                            form_edge_3  = np.append(point_e, point_d)
-                    else:
-                        form_edge_1 = np.append(point_b, point_c)
-                        if l_ae < l_af:
-                            form_edge_2  = np.append(point_a, point_e)
-                            form_edge_3  = np.append(point_f, point_d)
-                        else:
-                            form_edge_2  = np.append(point_a, point_f)
-                            form_edge_3  = np.append(point_e, point_d)
-                else:
-                    if l_ad < l_bd:
-                        form_edge_1 = np.append(point_a, point_d)
-                        if l_be < l_bf:
-                            form_edge_2  = np.append(point_b, point_e)
-                            form_edge_3  = np.append(point_f, point_c)
-                        else:
-                            form_edge_2  = np.append(point_b, point_f)
-                            form_edge_3  = np.append(point_e, point_c)
-                    else:
-                        form_edge_1 = np.append(point_b, point_d)
-                        if l_ae < l_af:
-                            form_edge_2  = np.append(point_a, point_e)
-                            form_edge_3  = np.append(point_f, point_c)
-                        else:
-                            form_edge_2  = np.append(point_a, point_f)
-                            form_edge_3  = np.append(point_e, point_c)
-                            
-                unwrapped_edge_1 = self.unwrap(r, form_edge_1)
-                unwrapped_edge_2 = self.unwrap(r, form_edge_2)
-                unwrapped_edge_3 = self.unwrap(r, form_edge_3)
-                if not(first_pass):
-
-                    edges = np.append(edges, np.array([unwrapped_edge_1]), 
-                                      axis = 0)
-                    edges = np.append(edges, np.array([unwrapped_edge_2]), 
-                                      axis = 0)
-                    edges = np.append(edges, np.array([unwrapped_edge_3]), 
-                                      axis = 0)
-                
-                else:
-                    edges = np.array([unwrapped_edge_1])
-                    edges = np.append(edges, np.array([unwrapped_edge_2]), 
-                                      axis = 0)
-                    edges = np.append(edges, np.array([unwrapped_edge_3]), 
-                                      axis = 0)
-                    first_pass = False
-        if first_pass:
-            edges = np.array([])
+    def orient_edges(self, edges:np.ndarray, 
+                     triangles:np.ndarray) -> np.ndarray:
+        """
+        Orients every edge of an (M, 6) array in place so that once it is 
+        unwrapped the inside of the mesh is on its left. "triangles" holds 
+        the index of the triangle each edge was found on.
+        
+        The normal n of the triangle points away from the inside of the 
+        mesh. For an edge with direction d and midpoint m, the unwrapped 
+        normal is on the right of the unwrapped edge when
+            (d x n) . (0, m_y, m_z) > 0
+        Edges that do not satisfy this are reversed.
+        """
+        d = edges[:, 3:] - edges[:, :3]
+        m = (edges[:, :3] + edges[:, 3:]) / 2
+        side = np.cross(d, self.normals[triangles])
+        reverse = np.sum(side[:, 1:] * m[:, 1:], axis = 1) < 0
+        edges[reverse] = np.roll(edges[reverse], 3, axis = 1)
         return edges
     
-    def case_4(self, r:float) -> np.ndarray:
-        #print("case 4")
-        first_pass = True
-        for i in range(len(self.tri_case_4)):
-            edge_1 = np.append(self.tri_case_4[i][3:6], 
-                               self.tri_case_4[i][6:])
-            edge_2 = np.append(self.tri_case_4[i][:3], 
-                               self.tri_case_4[i][3:6])
-            edge_3 = np.append(self.tri_case_4[i][:3], 
-                               self.tri_case_4[i][6:])      
-            d_1 = self.shortest_distance(edge_1)
-            d_2 = self.shortest_distance(edge_2)
-            d_3 = self.shortest_distance(edge_3)
-            
-            triangle_edges = np.array([edge_1, edge_2, edge_3])
-            distances = np.array([d_1, d_2, d_3])
-            greater_than_zero = np.where(distances > self.epsilon)
-            less_than_radius = np.where(distances < r)
-            
-            index = np.concatenate((greater_than_zero[0],
-                                    less_than_radius[0]), axis=0)
-            
-            elements, count = np.unique(index, return_counts = True)
-            duplicates = elements[count > 1]
-            if len(duplicates) == 0:
-                #print("case 4.1")
-                continue
+    def case_1(self, r:float) -> (np.ndarray, np.ndarray):
+        #Case 1
+        triangles = self.index_case_1
+        vertex_max = np.argmax(self.radii_case_1, axis = 1)
+        
+        point_1 = self.first_intersection(r, triangles, (vertex_max + 2) % 3)
+        point_2 = self.first_intersection(r, triangles, vertex_max)
+        
+        counts = np.ones(len(triangles), dtype = np.int64)
+        edges = np.empty((len(triangles), 3, 6))
+        edges[:, 0, :3] = point_1
+        edges[:, 0, 3:] = point_2
+        return counts, edges
             
-            elif len(duplicates) == 1:
-                #print("case 4.2")
-                intersecting_edge = triangle_edges[duplicates[0]]
-                point_1, point_2 = self.find_intersection(r, intersecting_edge)
-                form_edge = np.append(point_1, point_2)
-                unwrapped_edge = self.unwrap(r, form_edge)
-                
-                if first_pass:
-                    edges = np.array([unwrapped_edge])
-                    first_pass = False
-                else:
-                    edges = np.append(edges, np.array([unwrapped_edge]), axis = 0)
-                    
-            elif len(duplicates) == 2:
-                #print("case 4.3")
-                intersecting_edge_1 = triangle_edges[duplicates[0]]
-                intersecting_edge_2 = triangle_edges[duplicates[1]]
-                point_a, point_b = self.find_intersection(r, intersecting_edge_1)
-                point_c, point_d = self.find_intersection(r, intersecting_edge_2)
-                
-                points = np.array([point_a, point_b, point_c, point_d])
-                for point in points:
-                    difference = np.round(abs(points - point), 8)
-                    index = np.where(np.sum(difference, axis=1) < self.epsilon)
-                    if len(index[0]) == 2:
-                        points = np.delete(points, index, axis=0)
-                        break
-                if len(points) != 4:
-                    form_edge = np.append(points[0], points[1])
-                    unwrapped_edge = self.unwrap(r, form_edge)
-                    if not(first_pass):
-                        edges = np.append(edges, np.array([unwrapped_edge]), 
-                                          axis = 0)
-                    else:
-                        edges = np.array([unwrapped_edge])
-                        first_pass = False
-                else:
-                    l_ac = self.point_distance(point_a, point_c)
-                    l_ad = self.point_distance(point_a, point_d)
-                    
-                    l_bc = self.point_distance(point_b, point_c)
-                    l_bd = self.point_distance(point_b, point_d)
-                    
-                    if l_ac < l_ad:
-                        if l_ac < l_bc:
-                            form_edge_1 = np.append(point_a, point_c)
-                            form_edge_2 = np.append(point_b, point_d)
-                        else:
-                            form_edge_1 = np.append(point_a, point_d)
-                            form_edge_2 = np.append(point_b, point_c)
-                    else:
-                        if l_ad < l_bd:
-                            form_edge_1 = np.append(point_a, point_d)
-                            form_edge_2 = np.append(point_b, point_c)
-                        else:
-                            form_edge_1 = np.append(point_a, point_c)
-                            form_edge_2 = np.append(point_b, point_d)
-                    
-                    unwrapped_edge_1 = self.unwrap(r, form_edge_1)
-                    unwrapped_edge_2 = self.unwrap(r, form_edge_2)
-                    if not(first_pass):
-                        edges = np.append(edges, np.array([unwrapped_edge_1]), 
-                                          axis = 0)
-                        edges = np.append(edges, np.array([unwrapped_edge_2]), 
-                                          axis = 0)
-                    else:
-                        edges = np.array([unwrapped_edge_1])
-                        edges = np.append(edges, np.array([unwrapped_edge_2]), 
-                                          axis = 0)
-                        first_pass = False
-                    
-            elif len(duplicates) == 3:
-                #print("case 4.4")
-                intersecting_edge_1 = triangle_edges[duplicates[0]]
-                intersecting_edge_2 = triangle_edges[duplicates[1]]
-                intersecting_edge_3 = triangle_edges[duplicates[2]]
-                point_a, point_b = self.find_intersection(r, intersecting_edge_1)
-                point_c, point_d = self.find_intersection(r, intersecting_edge_2)
-                point_e, point_f = self.find_intersection(r, intersecting_edge_3)
-                
-                points = np.array([point_a, point_b, 
-                                   point_c, point_d,
-                                   point_e, point_f])
-                for point in points:
-                    difference = np.round(abs(points - point), 8)
-                    index = np.where(np.sum(difference, axis=1) < self.epsilon)
-                    if len(index[0]) == 2:
-                        points = np.delete(points, index, axis=0)
-                        break
-                point_a, point_b = points[0], points[1]
-                point_c, point_d = points[2], points[3]
-                
-                l_ac = self.point_distance(point_a, point_c)
-                l_ad = self.point_distance(point_a, point_d)
-                
-                l_bc = self.point_distance(point_b, point_c)
-                l_bd = self.point_distance(point_b, point_d)
-                
-                if l_ac < l_ad:
-                    if l_ac < l_bc:
-                        form_edge_1 = np.append(point_a, point_c)
-                        form_edge_2 = np.append(point_b, point_d)
-                    else:
-                        form_edge_1 = np.append(point_a, point_d)
-                        form_edge_2 = np.append(point_b, point_c)
-                else:
-                    if l_ad < l_bd:
-                        form_edge_1 = np.append(point_a, point_d)
-                        form_edge_2 = np.append(point_b, point_c)
-                    else:
-                        form_edge_1 = np.append(point_a, point_c)
-                        form_edge_2 = np.append(point_b, point_d)
-                
-                unwrapped_edge_1 = self.unwrap(r, form_edge_1)
-                unwrapped_edge_2 = self.unwrap(r, form_edge_2)
-                
-                if not(first_pass):
-                    edges = np.append(edges, np.array([unwrapped_edge_1]), 
-                                      axis = 0)
-                    edges = np.append(edges, np.array([unwrapped_edge_2]), 
-                                      axis = 0)
-                else:
-                    edges = np.array([unwrapped_edge_1])
-                    edges = np.append(edges, np.array([unwrapped_edge_2]), 
-                                      axis = 0)
-                    first_pass = False
-        if first_pass:
-            edges = np.array([])
-        return edges
+    def case_2(self, r:float) -> (np.ndarray, np.ndarray):
+        #Case 2
+        triangles = self.index_case_2
+        vertex_min = np.argmin(self.radii_case_2, axis = 1)
+        opposite_edges = (vertex_min + 1) % 3
+        edge_numbers_1 = np.where(vertex_min == 2, 1, 0)
+        edge_numbers_2 = np.where(vertex_min == 1, 1, 2)
+        d = self.edge_radii[triangles, opposite_edges]
+        
+        #Case 2.1
+        case_2_1 = (r < d) | (d == 0)
+        #Case 2.2
+        case_2_2 = (r > d) & (d != 0)
+        
+        point_1 = self.first_intersection(r, triangles, edge_numbers_1)
+        point_2 = self.first_intersection(r, triangles, edge_numbers_2)
+        
+        counts = np.zeros(len(triangles), dtype = np.int64)
+        edges = np.empty((len(triangles), 3, 6))
+        counts[case_2_1] = 1
+        edges[case_2_1, 0, :3] = point_1[case_2_1]
+        edges[case_2_1, 0, 3:] = point_2[case_2_1]
+        
+        if np.any(case_2_2):
+            point_e, point_f, _, _ = self.edge_intersections(
+                r, triangles[case_2_2], opposite_edges[case_2_2])
+            counts[case_2_2] = 2
+            edges[case_2_2, :2] = self.pair_points(point_1[case_2_2], 
+                                                   point_2[case_2_2], 
+                                                   point_e, point_f)
+        return counts, edges
     
-    def case_5(self, r:float) -> np.ndarray:
-        #print("case 5")
-        first_pass = True
-        for i in range(len(self.tri_case_5)):
-            r_1 = self.radii_case_5[i][0]
-            r_2 = self.radii_case_5[i][1]
-            r_3 = self.radii_case_5[i][2]
-            radii = np.array([r_1, r_2, r_3])
-            r_max = np.amax(radii)
-            r_min = np.amin(radii)
-            
-            index_max = int(np.where(abs(r_max - radii) < self.epsilon)[0] + 1) * 3
-            index_min = int(np.where(abs(r_min - radii) < self.epsilon)[0] + 1) * 3
-            if max(index_max, index_min) == 9:
-                index_mid = abs(index_max - index_min)
-            else:
-                index_mid = abs(index_max + index_min)
-            edge_1 = np.append(self.tri_case_5[i][(index_max - 3):index_max], 
-                               self.tri_case_5[i][(index_min - 3):index_min])
-            edge_2 = np.append(self.tri_case_5[i][(index_max - 3):index_max], 
-                               self.tri_case_5[i][(index_mid - 3):index_mid])
-            
-            vertex_on_circle = self.tri_case_5[i][(index_mid - 3):index_mid]
-            
-            point_a, point_b = self.find_intersection(r, edge_1)
-            if len(point_a) == 0:
-                point_1 = point_b
-            else:
-                point_1 = point_a
-                
-            distance = self.shortest_distance(edge_2)
-            if distance != 0 and distance < r:
-                #print("case 5.1")
-                point_c, point_d = self.find_intersection(r, edge_2)
-                sum_difference_c = sum(abs(point_c - vertex_on_circle))
-                sum_difference_d = sum(abs(point_d - vertex_on_circle))
-                if sum_difference_c < sum_difference_d:
-                    point_2 = point_d
-                else:
-                    point_2 = point_c
-                    
-            else:
-                #print("case 5.2")
-                point_2 = vertex_on_circle
-                
-            form_edge = np.append(point_1, point_2)
-            unwrapped_edge = self.unwrap(r, form_edge)
-            
-            if first_pass:
-                    edges = np.array([unwrapped_edge])
-                    first_pass = False
+    def case_3(self, r:float) -> (np.ndarray, np.ndarray):
+        #Case 3
+        return self.case_3_4(r, self.index_case_3, merge_vertex = False)
+    
+    def case_4(self, r:float) -> (np.ndarray, np.ndarray):
+        #Case 4
+        return self.case_3_4(r, self.index_case_4, merge_vertex = True)
+    
+    def case_3_4(self, r:float, triangles:np.ndarray, 
+                 merge_vertex:bool) -> (np.ndarray, np.ndarray):
+        """
+        Case 3 and Case 4 both intersect every edge with a closest point to
+        the x-axis inside the cylinder twice. In Case 4 the vertex on the 
+        cylinder can be found twice, it is removed before the points are 
+        paired (merge_vertex).
+        """
+        triangle_edges = np.array([1, 0, 2])
+        distances = self.edge_radii[triangles][:, triangle_edges]
+        intersecting = (distances > self.epsilon) & (distances < r)
+        num_intersecting = np.sum(intersecting, axis = 1)
+        
+        #Intersecting edges first while keeping their order
+        order = np.argsort(~intersecting, axis = 1, kind = "stable")
+        edge_numbers = triangle_edges[order]
+        
+        counts = np.zeros(len(triangles), dtype = np.int64)
+        edges = np.empty((len(triangles), 3, 6))
+        
+        #Case 3.2 / case 4.2
+        one = num_intersecting == 1
+        if np.any(one):
+            point_a, point_b, _, _ = self.edge_intersections(
+                r, triangles[one], edge_numbers[one, 0])
+            counts[one] = 1
+            edges[one, 0, :3] = point_a
+            edges[one, 0, 3:] = point_b
+        
+        #Case 3.3 / case 4.3
+        two = num_intersecting == 2
+        if np.any(two):
+            point_a, point_b, _, _ = self.edge_intersections(
+                r, triangles[two], edge_numbers[two, 0])
+            point_c, point_d, _, _ = self.edge_intersections(
+                r, triangles[two], edge_numbers[two, 1])
+            pairs = self.pair_points(point_a, point_b, point_c, point_d)
+            counts_two = np.full(len(pairs), 2)
+            if merge_vertex:
+                points = np.stack((point_a, point_b, point_c, point_d), axis = 1)
+                found, remaining = self.remove_coincident(points)
+                counts_two[found] = 1
+                pairs[found, 0, :3] = remaining[:, 0]
+                pairs[found, 0, 3:] = remaining[:, 1]
+            counts[two] = counts_two
+            edges[two, :2] = pairs
+        
+        #Case 3.4 / case 4.4
+        three = num_intersecting == 3
+        if np.any(three):
+            point_a, point_b, _, _ = self.edge_intersections(
+                r, triangles[three], edge_numbers[three, 0])
+            point_c, point_d, _, _ = self.edge_intersections(
+                r, triangles[three], edge_numbers[three, 1])
+            point_e, point_f, _, _ = self.edge_intersections(
+                r, triangles[three], edge_numbers[three, 2])
+            if merge_vertex:
+                points = np.stack((point_a, point_b, point_c, 
+                                   point_d, point_e, point_f), axis = 1)
+                found, remaining = self.remove_coincident(points)
+                points[found, :4] = remaining
+                counts[three] = 2
+                edges[three, :2] = self.pair_points(points[:, 0], points[:, 1],
+                                                    points[:, 2], points[:, 3])
             else:
-                edges = np.append(edges, np.array([unwrapped_edge]), axis = 0)
-                
-        if first_pass:
-            edges = np.array([])
-        return edges
+                counts[three] = 3
+                edges[three] = self.pair_points_3(point_a, point_b, point_c, 
+                                                  point_d, point_e, point_f)
+        return counts, edges
     
+    def case_5(self, r:float) -> (np.ndarray, np.ndarray):
+        #Case 5
+        triangles = self.index_case_5
+        vertex_order = np.argsort(self.radii_case_5, axis = 1)
+        vertex_min = vertex_order[:, 0]
+        vertex_mid = vertex_order[:, 1]
+        vertex_max = vertex_order[:, 2]
+        edge_numbers_1 = self.edge_number(vertex_max, vertex_min)
+        edge_numbers_2 = self.edge_number(vertex_max, vertex_mid)
+        distances = self.edge_radii[triangles, edge_numbers_2]
+        vertex_on_circle = self.tri_case_5[np.arange(len(triangles)), 
+                                           vertex_mid]
+        
+        point_1 = self.first_intersection(r, triangles, edge_numbers_1)
+        
+        #Case 5.2
+        point_2 = vertex_on_circle.copy()
+        
+        #Case 5.1
+        case_5_1 = (distances != 0) & (distances < r)
+        if np.any(case_5_1):
+            point_c, point_d, _, _ = self.edge_intersections(
+                r, triangles[case_5_1], edge_numbers_2[case_5_1])
+            vertex = vertex_on_circle[case_5_1]
+            sum_difference_c = np.sum(abs(point_c - vertex), axis = 1)
+            sum_difference_d = np.sum(abs(point_d - vertex), axis = 1)
+            closer_c = (sum_difference_c < sum_difference_d)[:, np.newaxis]
+            point_2[case_5_1] = np.where(closer_c, point_d, point_c)
+        
+        counts = np.ones(len(triangles), dtype = np.int64)
+        edges = np.empty((len(triangles), 3, 6))
+        edges[:, 0, :3] = point_1
+        edges[:, 0, 3:] = point_2
+        return counts, edges
     
-    def case_6(self, r:float) -> np.ndarray:
-        #print("case 6")
-        first_pass = True
-        for i in range(len(self.tri_case_6)):
-            r_1 = self.radii_case_6[i][0]
-            r_2 = self.radii_case_6[i][1]
-            r_3 = self.radii_case_6[i][2]
-            if (r < r_1):
-                edge_1 = np.append(self.tri_case_6[i][6:], 
-                                  self.tri_case_6[i][:3])
-                edge_2 = np.append(self.tri_case_6[i][3:6], 
-                                  self.tri_case_6[i][:3])
-                edge_on_cylinder = np.append(self.tri_case_6[i][3:6], 
-                                             self.tri_case_6[i][6:])
-            elif (r < r_2):
-                edge_1 = np.append(self.tri_case_6[i][:3], 
-                                  self.tri_case_6[i][3:6])
-                edge_2 = np.append(self.tri_case_6[i][6:], 
-                                  self.tri_case_6[i][3:6])      
-                edge_on_cylinder = np.append(self.tri_case_6[i][:3], 
-                                             self.tri_case_6[i][6:])
-            elif (r < r_3):
-                edge_1 = np.append(self.tri_case_6[i][3:6], 
-                                  self.tri_case_6[i][6:])
-                edge_2 = np.append(self.tri_case_6[i][:3], 
-                                  self.tri_case_6[i][6:])
-                edge_on_cylinder = np.append(self.tri_case_6[i][3:6], 
-                                             self.tri_case_6[i][:3])
-                
-            d_1 = self.shortest_distance(edge_1)
-            d_2 = self.shortest_distance(edge_2)
-            
-            triangle_edges = np.array([edge_1, edge_2])
-            distances = np.array([d_1, d_2])
-            greater_than_zero = np.where(distances > self.epsilon)
-            less_than_radius = np.where(distances < r)
-            
-            index = np.concatenate((greater_than_zero[0],
-                                    less_than_radius[0]), axis=0)
-            
-            elements, count = np.unique(index, return_counts = True)
-            duplicates = elements[count > 1]
-            if len(duplicates) == 0:
-                #print("case 6.1")
-                intersecting_edge = edge_on_cylinder
-                unwrapped_edge = self.unwrap(r, intersecting_edge)
-                if first_pass:
-                    edges = np.array([unwrapped_edge])
-                    first_pass = False
-                else:
-                    edges = np.append(edges, np.array([unwrapped_edge]), axis = 0)
-                
-            if len(duplicates) == 1:
-                #print("case 6.2")
-                intersecting_edge_1 = triangle_edges[duplicates[0]]
-                intersecting_edge_2 = edge_on_cylinder
-                point_a, point_b = self.find_intersection(r, intersecting_edge_1)
-                point_c, point_d = (intersecting_edge_2[:3], intersecting_edge_2[3:])
-                
-                points = np.array([point_a, point_b, point_c, point_d])
-                for point in points:
-                    difference = np.round(abs(points - point), 8)
-                    index = np.where(np.sum(difference, axis=1) < self.epsilon)
-                    if len(index[0]) == 2:
-                        points = np.delete(points, index, axis=0)
-                        break
-                form_edge = np.append(points[0], points[1])
-                unwrapped_edge = self.unwrap(r, form_edge)
-                if not(first_pass):
-                    edges = np.append(edges, np.array([unwrapped_edge]), 
-                                      axis = 0)
-                else:
-                    edges = np.array([unwrapped_edge])
-                    first_pass = False
-                    
-            elif len(duplicates) == 2:
-                #print("case 6.3")
-                intersecting_edge_1 = triangle_edges[duplicates[0]]
-                intersecting_edge_2 = triangle_edges[duplicates[1]]
-                
-                point_a, point_b = self.find_intersection(r, intersecting_edge_1)
-                point_c, point_d = self.find_intersection(r, intersecting_edge_2)
-                
-                l_ac = self.point_distance(point_a, point_c)
-                l_ad = self.point_distance(point_a, point_d)
-                
-                l_bc = self.point_distance(point_b, point_c)
-                l_bd = self.point_distance(point_b, point_d)
-                
-                if l_ac < l_ad:
-                    if l_ac < l_bc:
-                        form_edge_1 = np.append(point_a, point_c)
-                        form_edge_2 = np.append(point_b, point_d)
-                    else:
-                        form_edge_1 = np.append(point_a, point_d)
-                        form_edge_2 = np.append(point_b, point_c)
-                else:
-                    if l_ad < l_bd:
-                        form_edge_1 = np.append(point_a, point_d)
-                        form_edge_2 = np.append(point_b, point_c)
-                    else:
-                        form_edge_1 = np.append(point_a, point_c)
-                        form_edge_2 = np.append(point_b, point_d)
-                
-                unwrapped_edge_1 = self.unwrap(r, form_edge_1)
-                unwrapped_edge_2 = self.unwrap(r, form_edge_2)
-                
-                if not(first_pass):
-                    edges = np.append(edges, np.array([unwrapped_edge_1]), 
-                                      axis = 0)
-                    edges = np.append(edges, np.array([unwrapped_edge_2]), 
-                                      axis = 0)
-                else:
-                    edges = np.array([unwrapped_edge_1])
-                    edges = np.append(edges, np.array([unwrapped_edge_2]), 
-                                      axis = 0)
-                    first_pass = False
-                
-        if first_pass:
-            edges = np.array([])
-        return edges
+    def case_6(self, r:float) -> (np.ndarray, np.ndarray):
+        #Case 6
+        triangles = self.index_case_6
+        vertex_max = np.argmax(self.radii_case_6, axis = 1)
+        triangle_edges = np.stack(((vertex_max + 2) % 3, vertex_max), axis = 1)
+        distances = np.take_along_axis(self.edge_radii[triangles], 
+                                       triangle_edges, axis = 1)
+        intersecting = (distances > self.epsilon) & (distances < r)
+        num_intersecting = np.sum(intersecting, axis = 1)
+        order = np.argsort(~intersecting, axis = 1, kind = "stable")
+        edge_numbers = np.take_along_axis(triangle_edges, order, axis = 1)
+        
+        #Vertices on the cylinder
+        vertices = self.tri_case_6
+        rows = np.arange(len(triangles))
+        vertex_1 = vertices[rows, np.where(vertex_max == 1, 0, 1)]
+        vertex_2 = vertices[rows, np.where(vertex_max == 2, 0, 2)]
+        
+        counts = np.zeros(len(triangles), dtype = np.int64)
+        edges = np.empty((len(triangles), 3, 6))
+        
+        #Case 6.1
+        none = num_intersecting == 0
+        counts[none] = 1
+        edges[none, 0, :3] = vertex_1[none]
+        edges[none, 0, 3:] = vertex_2[none]
+        
+        #Case 6.2
+        one = num_intersecting == 1
+        if np.any(one):
+            point_a, point_b, _, _ = self.edge_intersections(
+                r, triangles[one], edge_numbers[one, 0])
+            points = np.stack((point_a, point_b, 
+                               vertex_1[one], vertex_2[one]), axis = 1)
+            found, remaining = self.remove_coincident(points)
+            points[found, :2] = remaining
+            counts[one] = 1
+            edges[one, 0, :3] = points[:, 0]
+            edges[one, 0, 3:] = points[:, 1]
+        
+        #Case 6.3
+        two = num_intersecting == 2
+        if np.any(two):
+            point_a, point_b, _, _ = self.edge_intersections(
+                r, triangles[two], edge_numbers[two, 0])
+            point_c, point_d, _, _ = self.edge_intersections(
+                r, triangles[two], edge_numbers[two, 1])
+            counts[two] = 2
+            edges[two, :2] = self.pair_points(point_a, point_b, 
+                                              point_c, point_d)
+        return counts, edges
     
-    def reconstruct_edges(self, r:float, edges:np.ndarray) -> np.ndarray:
-        first_pass = True
-        num_edges = len(edges)
-        delete_edges = []
-        for i in range(num_edges):
-            if (abs(edges[i][1] - edges[i][4]) > (self.delta_y * 0.6)):
-                delete_edges += [i]
-                edge = np.array([edges[i][:3], edges[i][3:]])
-                edge_sorted = sorted(edge, key=lambda y: y[1])
-                if first_pass:
-                    point_array_start = np.array([edge_sorted[0]])
-                    point_array_end = np.array([edge_sorted[1]])
-                    first_pass = False
-                else:
-                    point_array_start = np.append(point_array_start, 
-                                                  np.array([edge_sorted[0]]), 
-                                                  axis = 0)
-                    point_array_end = np.append(point_array_end, 
-                                                np.array([edge_sorted[1]]), 
-                                                axis = 0)
-                    
-        if not(first_pass):
-            point_array_start = sorted(point_array_start, key=lambda x: x[0])
-            point_array_end = sorted(point_array_end, key=lambda x: x[0])
-            if len(point_array_start) % 2 != 0:
-                return "error"
+    def first_intersection(self, r:float, triangles:np.ndarray, 
+                           edge_numbers:np.ndarray) -> np.ndarray:
+        """
+        Returns the first intersection point of each edge that fits within
+        the bounds of the edge. Used for edges that cross the cylinder 
+        once.
+        """
+        points_1, points_2, valid_1, _ = self.edge_intersections(
+            r, triangles, edge_numbers)
+        return np.where(valid_1[:, np.newaxis], points_1, points_2)
+    
+    def pair_points(self, point_a:np.ndarray, point_b:np.ndarray, 
+                    point_c:np.ndarray, point_d:np.ndarray) -> np.ndarray:
+        """
+        Pairs points a and b of one edge with points c and d of another 
+        edge to form two edges, returned as an array of shape (M, 2, 6):
+            if l_ac < l_ad:
+                if l_ac < l_bc: (a, c), (b, d)
+                else: (a, d), (b, c)
             else:
-                for i in range(0, len(point_array_start), 2):
-                    form_edge_start = point_array_start[i]
-                    form_edge_end = point_array_end[i]
-                    form_edge_start = np.append(form_edge_start, point_array_start[i+1])
-                    form_edge_end = np.append(form_edge_end, point_array_end[i+1])
-                    edges = np.append(edges, np.array([form_edge_start]), axis = 0)
-                    edges = np.append(edges, np.array([form_edge_end]), axis = 0)
-            edges = np.delete(edges, tuple(delete_edges), axis=0)
+                if l_ad < l_bd: (a, d), (b, c)
+                else: (a, c), (b, d)
+        """
+        l_ac = np.linalg.norm(point_c - point_a, axis = 1)
+        l_ad = np.linalg.norm(point_d - point_a, axis = 1)
+        l_bc = np.linalg.norm(point_c - point_b, axis = 1)
+        l_bd = np.linalg.norm(point_d - point_b, axis = 1)
+        straight = np.where(l_ac < l_ad, l_ac < l_bc, ~(l_ad < l_bd))
+        straight = straight[:, np.newaxis]
+        
+        edges = np.empty((len(point_a), 2, 6))
+        edges[:, 0, :3] = point_a
+        edges[:, 0, 3:] = np.where(straight, point_c, point_d)
+        edges[:, 1, :3] = point_b
+        edges[:, 1, 3:] = np.where(straight, point_d, point_c)
+        return edges
+    
+    def pair_points_3(self, point_a:np.ndarray, point_b:np.ndarray, 
+                      point_c:np.ndarray, point_d:np.ndarray,
+                      point_e:np.ndarray, point_f:np.ndarray) -> np.ndarray:
+        """
+        Pairs the points of three edges (a, b), (c, d) and (e, f) to form 
+        three edges, returned as an array of shape (M, 3, 6). The first 
+        edge joins the closest points p of (a, b) and q of (c, d). The 
+        remaining point p' of (a, b) is joined to the closer point of 
+        (e, f) and the last edge joins the other point of (e, f) to the 
+        remaining point q' of (c, d).
+        """
+        l_ac = np.linalg.norm(point_c - point_a, axis = 1)
+        l_ad = np.linalg.norm(point_d - point_a, axis = 1)
+        l_bc = np.linalg.norm(point_c - point_b, axis = 1)
+        l_bd = np.linalg.norm(point_d - point_b, axis = 1)
+        closer_c = l_ac < l_ad
+        p_is_a = np.where(closer_c, l_ac < l_bc, l_ad < l_bd)
+        
+        closer_c = closer_c[:, np.newaxis]
+        p_is_a = p_is_a[:, np.newaxis]
+        p = np.where(p_is_a, point_a, point_b)
+        p_other = np.where(p_is_a, point_b, point_a)
+        q = np.where(closer_c, point_c, point_d)
+        q_other = np.where(closer_c, point_d, point_c)
+        
+        l_pe = np.linalg.norm(point_e - p_other, axis = 1)
+        l_pf = np.linalg.norm(point_f - p_other, axis = 1)
+        closer_e = (l_pe < l_pf)[:, np.newaxis]
+        
+        edges = np.empty((len(point_a), 3, 6))
+        edges[:, 0, :3] = p
+        edges[:, 0, 3:] = q
+        edges[:, 1, :3] = p_other
+        edges[:, 1, 3:] = np.where(closer_e, point_e, point_f)
+        edges[:, 2, :3] = np.where(closer_e, point_f, point_e)
+        edges[:, 2, 3:] = q_other
         return edges
     
-    def point_distance(self, point_1:np.ndarray, point_2:np.ndarray) -> float:
+    def remove_coincident(self, points:np.ndarray) -> (np.ndarray, np.ndarray):
         """
-        Returns magnitude of vector v_12. This is the distance between points
-        1 and 2.
+        Given groups of points of shape (M, P, 3), the first point of each 
+        group that coincides with exactly one other point is removed along
+        with that other point (a vertex found on two edges). Returns the 
+        mask of the groups where a pair was found and the (P - 2) remaining
+        points of those groups.
         """
-        v_12 = np.subtract(point_2, point_1)
-        mag_v_12 = np.sqrt(np.sum(np.power(v_12, 2)))
-        return mag_v_12
+        difference = np.round(abs(points[:, :, np.newaxis] - 
+                                  points[:, np.newaxis]), 8)
+        coincident = np.sum(difference, axis = 3) < self.epsilon
+        pair = np.sum(coincident, axis = 2) == 2
+        found = np.any(pair, axis = 1)
+        first = np.argmax(pair, axis = 1)
+        keep = ~coincident[np.arange(len(points)), first][found]
+        remaining = points[found][keep].reshape(-1, points.shape[1] - 2, 3)
+        return found, remaining
+    
+    def reconstruct_edges(self, r:float, edges:np.ndarray) -> np.ndarray:
+        """
+        Edges that cross the seam of the unwrapped cylinder (theta = 0) span
+        almost the whole of delta_y. They are removed and their end points 
+        are sorted by x; consecutive lower points and consecutive upper 
+        points are joined to form the edges along the seam.
         
+        To keep the orientation of the edges (see orient_edges), each edge 
+        along the seam starts at the point where the removed edge left its 
+        side of the seam.
+        """
+        seam = abs(edges[:, 1] - edges[:, 4]) > (self.delta_y * 0.6)
+        if not np.any(seam):
+            return edges
+        if np.sum(seam) % 2 != 0:
+            return "error"
+        
+        seam_edges = edges[seam]
+        lower_first = (seam_edges[:, 1] < seam_edges[:, 4])[:, np.newaxis]
+        point_array_start = np.where(lower_first, seam_edges[:, :3], 
+                                     seam_edges[:, 3:])
+        point_array_end = np.where(lower_first, seam_edges[:, 3:], 
+                                   seam_edges[:, :3])
+        order_start = np.argsort(point_array_start[:, 0], kind = "stable")
+        order_end = np.argsort(point_array_end[:, 0], kind = "stable")
+        point_array_start = point_array_start[order_start]
+        point_array_end = point_array_end[order_end]
+        leaving_start = lower_first[order_start, 0]
+        leaving_end = ~lower_first[order_end, 0]
+        
+        form_edges = np.empty((len(seam_edges), 6))
+        form_edges[0::2] = point_array_start.reshape(-1, 6)
+        form_edges[1::2] = point_array_end.reshape(-1, 6)
+        reverse = np.empty(len(seam_edges), dtype = bool)
+        reverse[0::2] = ~leaving_start[0::2]
+        reverse[1::2] = ~leaving_end[0::2]
+        form_edges[reverse] = np.roll(form_edges[reverse], 3, axis = 1)
+        
+        return np.concatenate((edges[~seam], form_edges))
     
-    def find_intersection(self, r:float, edge:np.ndarray) -> (np.ndarray, np.ndarray):
+    def edge_intersections(self, r:float, triangles:np.ndarray, 
+                           edge_numbers:np.ndarray) -> (np.ndarray, 
+                                                        np.ndarray, 
+                                                        np.ndarray, 
+                                                        np.ndarray):
         """
-        Find intersection point:
+        Returns the two intersection points with the cylinder of radius r 
+        of the edges of the mesh given by the index of their triangle and 
+        their edge number (see build_edge_table) as (M, 3) arrays, along 
+        with the boolean masks of the points that fit within the bounds of
+        their edge.
             Parametric Equations of line in R3:
                 x(t) = x_o + v_x*t 
                 y(t) = y_o + v_y*t 
@@ -1104,667 +1063,802 @@ class cylindrical_slicer:
                 a = (v_y)^2 + (v_z)^2
                 b = 2 * (y_o * v_y + z_o * v_z)
                 c = (y_o)^2 + (z_o)^2 - r^2
-            For roots t1, t2 find which if they result in points that
-            fit within the bounds of the edge. 
-        """
-        v_o = edge[:3]
-        v = np.subtract(edge[:3], edge[3:])
-        a = v[1] ** 2 + v[2] ** 2
-        b = 2 * (v_o[1] * v[1] + v_o[2] * v[2])
-        c = (v_o[1] ** 2) + (v_o[2] ** 2) - (r ** 2) 
-        roots = np.roots([a, b, c])
-        
-        x_1, x_2 = v_o[0] + np.multiply(roots, v[0])
-        y_1, y_2 = v_o[1] + np.multiply(roots, v[1])
-        z_1, z_2 = v_o[2] + np.multiply(roots, v[2])
-        
-        x_min = min(edge[0], edge[3])
-        x_max = max(edge[0], edge[3])
-        y_min = min(edge[1], edge[4])
-        y_max = max(edge[1], edge[4])
-        z_min = min(edge[2], edge[5])
-        z_max = max(edge[2], edge[5])
-        
-        equal_to_min_x = abs(x_min - x_1) < self.epsilon
-        equal_to_max_x = abs(x_max - x_1) < self.epsilon
-        equal_to_min_y = abs(y_min - y_1) < self.epsilon
-        equal_to_max_y = abs(y_max - y_1) < self.epsilon
-        equal_to_min_z = abs(z_min - z_1) < self.epsilon
-        equal_to_max_z = abs(z_max - z_1) < self.epsilon
-        
-        if (x_min < x_1 < x_max or equal_to_min_x or equal_to_max_x)  and \
-           (y_min < y_1 < y_max or equal_to_min_y or equal_to_max_y) and \
-           (z_min < z_1 < z_max or equal_to_min_z or equal_to_max_z):
-            point_1 = np.array([x_1, y_1, z_1])
-        else:
-            point_1 = np.array([])
-        
-        equal_to_min_x = abs(x_min - x_2) < self.epsilon
-        equal_to_max_x = abs(x_max - x_2) < self.epsilon
-        equal_to_min_y = abs(y_min - y_2) < self.epsilon
-        equal_to_max_y = abs(y_max - y_2) < self.epsilon
-        equal_to_min_z = abs(z_min - z_2) < self.epsilon
-        equal_to_max_z = abs(z_max - z_2) < self.epsilon
-        
-        if (x_min < x_2 < x_max or equal_to_min_x or equal_to_max_x)  and \
-           (y_min < y_2 < y_max or equal_to_min_y or equal_to_max_y) and \
-           (z_min < z_2 < z_max or equal_to_min_z or equal_to_max_z):
-            point_2 = np.array([x_2, y_2, z_2])
-        else:
-            point_2 = np.array([])
+        The coefficients are read from the edge table since only the 
+        constant term of the quadratic equation depends on r:
+            c = edge_c - r^2
+            b^2 - 4ac = edge_discriminant + 4 * a * r^2
+        """
+        v_o = self.triangles[triangles, edge_numbers]
+        v_e = self.triangles[triangles, (edge_numbers + 1) % 3]
+        a = self.edge_a[triangles, edge_numbers]
+        b = self.edge_b[triangles, edge_numbers]
+        c = self.edge_c[triangles, edge_numbers] - r ** 2
+        discriminant = (self.edge_discriminant[triangles, edge_numbers] + 
+                        4 * a * r ** 2)
+        return self.solve_intersections(v_o, v_e, a, b, c, discriminant)
     
-        return point_1, point_2
+    def solve_intersections(self, v_o:np.ndarray, v_e:np.ndarray, 
+                            a:np.ndarray, b:np.ndarray, c:np.ndarray, 
+                            discriminant:np.ndarray) -> (np.ndarray, 
+                                                         np.ndarray, 
+                                                         np.ndarray, 
+                                                         np.ndarray):
+        """
+        Solves the quadratic equations of edges from v_o to v_e for
+        edge_intersections in closed form:
+            t = (-b -/+ sqrt(b^2 - 4ac)) / 2a
+        To avoid cancellation when b^2 >> 4ac the root with the larger 
+        magnitude is found first and the other root is given by
+            t_1 * t_2 = c / a
+        Edges that never reach the cylinder (b^2 - 4ac < 0) or that are 
+        parallel to the x-axis (a = 0) have no valid intersection points.
+        """
+        v = v_o - v_e
+        solvable = (discriminant >= 0) & (a > 0)
+        
+        #Placeholder coefficients for edges without roots
+        a = np.where(solvable, a, 1)
+        discriminant = np.where(solvable, discriminant, 0)
+        q = -0.5 * (b + np.copysign(np.sqrt(discriminant), b))
+        q_nonzero = q != 0
+        t_q = q / a
+        t_c = np.divide(c, q, out = np.zeros_like(q), where = q_nonzero)
+        t_1 = np.minimum(t_q, t_c)
+        t_2 = np.maximum(t_q, t_c)
+        
+        points_1 = v_o + t_1[:, np.newaxis] * v
+        points_2 = v_o + t_2[:, np.newaxis] * v
+        
+        lower = np.minimum(v_o, v_e) - self.epsilon
+        upper = np.maximum(v_o, v_e) + self.epsilon
+        valid_1 = solvable & np.all((lower < points_1) & (points_1 < upper), 
+                                    axis = 1)
+        valid_2 = solvable & np.all((lower < points_2) & (points_2 < upper), 
+                                    axis = 1)
+        return points_1, points_2, valid_1, valid_2
     
-    def unwrap(self, r:float, edge:np.ndarray) -> np.ndarray:
-        """
-        Given the intersection point (x, y, z), and vector in yz-plane 
-        V = <a, b>  where:
-                            a = y
-                            b = z
-        Find the angle vector <a, b> makes with positive y-axis:
-            if <a, b> in Q1:
-                theta = arctan(b/a)
-            elif <a, b> in Q2:
-                theta = arctan(b/a) + pi
-            elif <a, b> in Q3:
-                theta = arctan(b/a) + pi
-            elif <a, b> in Q4:
-                theta = arctan(b/a) + 2 * pi
-        Find the arc length:
-            s = theta * r
-        Scale based on delta_y and the circumference:
-            s' = s * (delta_y / (2 * pi * r)) 
-        Unwrap to a plane parallel to xy-plane that is translated 
-        along the z-axis to [z' = r - cylinder radius] since the
-        z-endstop will be level with the surface of the cylinder.
-        
-        The point will be transformed to point':
-                        
-                         point' = (x, s', z')
-        """
-        for i in range(0, 6, 3):
-            a = edge[i+1]
-            b = edge[i+2] 
-            if a != 0:
-                if (a > 0) and (b >= 0):
-                    theta = np.arctan(b/a)
-                elif (a < 0 and b >= 0) or (a < 0 and b < 0):
-                    theta = np.arctan(b/a) + np.pi
-                else:
-                    theta = np.arctan(b/a) + 2 * np.pi
-            else:
-                if b > 0:
-                    theta = np.pi / 2
-                else:
-                    theta = 3 * np.pi / 2
-            
-            edge[i+1] = (theta * r) * self.delta_y / (2 * np.pi * r) 
-            edge[i+2] = round((r - self.cylinder_diameter / 2), 2)
-        return edge
+    def edge_number(self, vertex_1:np.ndarray, 
+                    vertex_2:np.ndarray) -> np.ndarray:
+        """
+        Returns the number of the edge joining two vertices of a triangle.
+        Edge k goes from vertex k to vertex k + 1.
+        """
+        return np.where((vertex_1 + 1) % 3 == vertex_2, vertex_1, vertex_2)
     
-    def shortest_distance(self, edge:np.ndarray) -> float:
+    def unwrap_edges(self, r:float, edges:np.ndarray) -> np.ndarray:
         """
-        Returns shortest distance between edge and x-axis.
-        
-        This is an optimization problem:
-        Parametric Equations of line in R3:
-                x(t) = x_o + v_x*t 
-                y(t) = y_o + v_y*t 
-                z(t) = z_o + v_z*t
-        Distance from the x-axis:
-                d(t) = sqrt(y(t)^2 + z(t)^2)
-        Through substitution:
-                d(t) = sqrt((y_o + v_y*t )^2 + (z_o + v_z*t)^2)
-        Take the derivative of d with respect to t:
-               d'(t) = ((v_y)^2 +(v_z)^2 + v_y * y_o + v_z * z_o) /
-                       sqrt((y_o + v_y*t )^2 + (z_o + v_z*t)^2)
-        Find the value of t at d'(t) = 0:
-                   0 = (((v_y)^2 +(v_z)^2) * t + v_y * y_o + v_z * z_o) /
-                       sqrt((y_o + v_y*t )^2 + (z_o + v_z*t)^2)
-        The expression for t is:
-                   t = -(v_y * y_o + v_z * z_o) / ((v_y)^2 +(v_z)^2)
-        Determine if x(t), y(t), z(t) fit within the bounds of the edge. If
-        they fit, return the resulting distance d. If they don't fit, return 0.
-        """
-        
-        v_o = edge[:3]
-        v = np.subtract(edge[:3], edge[3:])
-        if abs(v[1]) < self.epsilon and abs(v[2]) < self.epsilon: 
-            return 0
-        t = -(v_o[1] * v[1] + v_o[2] * v[2]) / (v[1] ** 2 + v[2] ** 2) 
-        
-        
-        x = v_o[0] + np.multiply(t, v[0])
-        y = v_o[1] + np.multiply(t, v[1])
-        z = v_o[2] + np.multiply(t, v[2])
-        
-        x_min = min(edge[0], edge[3])
-        x_max = max(edge[0], edge[3])
-        y_min = min(edge[1], edge[4])
-        y_max = max(edge[1], edge[4])
-        z_min = min(edge[2], edge[5])
-        z_max = max(edge[2], edge[5])
-        
-        equal_to_min_x = abs(x_min - x) < self.epsilon
-        equal_to_max_x = abs(x_max - x) < self.epsilon
-        equal_to_min_y = abs(y_min - y) < self.epsilon
-        equal_to_max_y = abs(y_max - y) < self.epsilon
-        equal_to_min_z = abs(z_min - z) < self.epsilon
-        equal_to_max_z = abs(z_max - z) < self.epsilon
-        
-        if (x_min < x < x_max or equal_to_min_x or equal_to_max_x)  and \
-           (y_min < y < y_max or equal_to_min_y or equal_to_max_y) and \
-           (z_min < z < z_max or equal_to_min_z or equal_to_max_z):
-            d = np.sqrt(y ** 2 + z ** 2)
-        else:
-            d = 0    
-        return d
+        Unwraps an (M, 6) array of edges in place. For every point 
+        (x, y, z) the angle theta that the vector <y, z> makes with the 
+        positive y-axis is found in one pass with
+            theta = arctan2(z, y) 
+        and wrapped into the interval [0, 2 * pi). The arc length 
+        s = theta * r is scaled based on delta_y and the circumference, so
+        the radius cancels out:
+            s' = (theta * r) * (delta_y / (2 * pi * r)) 
+               = theta * delta_y / (2 * pi)
+        The point is unwrapped to a plane parallel to the xy-plane that is 
+        translated along the z-axis to [z' = r - cylinder radius] since the
+        z-endstop will be level with the surface of the cylinder:
+            point' = (x, s', z')
+        """
+        theta = np.arctan2(edges[:, 2::3], edges[:, 1::3])
+        theta[theta < 0] += 2 * np.pi
+        theta[theta >= 2 * np.pi] -= 2 * np.pi
+        edges[:, 1::3] = theta * self.delta_y / (2 * np.pi)
+        edges[:, 2::3] = round((r - self.cylinder_diameter / 2), 2)
+        return edges
     
+    def stitch_loops(self, edges:np.ndarray) -> list:
+        """
+        Returns a list of arrays of closed loops formed by joining the edges
+        end to end.
+
+        The end points of the edges are quantized to a grid with a spacing
+        of epsilon and placed in a hash map from grid cell to the end
+        points inside it. The next edge of a loop is looked up in the cell
+        of the last point of the loop and its eight neighbouring cells so
+        points that round to different cells are still matched. Each edge
+        is used once, which makes stitching linear in the number of edges.
+        Duplicate edges running in the same direction are dropped, and 
+        loops of two edges (an edge and its reverse) are discarded since 
+        they do not enclose an area.
+
+        The start and end point of every chain that can not be closed are
+        stored in self.unmatched_endpoints.
+        """
+        z = edges[0][2]
+        points = edges[:, [0, 1, 3, 4]].reshape(-1, 2).tolist()
+        keys = np.floor(edges[:, [0, 1, 3, 4]].reshape(-1, 2) /
+                        self.epsilon).astype(np.int64).tolist()
+        endpoint_map = dict()
+        for i, key in enumerate(keys):
+            endpoint_map.setdefault(tuple(key), []).append(i)
+        neighbours = [(i, j) for i in (-1, 0, 1) for j in (-1, 0, 1)]
+        used = [False] * len(edges)
+
+        def coincident(point_1:list, point_2:list) -> bool:
+            return (abs(point_1[0] - point_2[0]) < self.epsilon and
+                    abs(point_1[1] - point_2[1]) < self.epsilon)
+
+        def next_endpoint(point:int) -> int:
+            key_x, key_y = keys[point]
+            for i, j in neighbours:
+                for candidate in endpoint_map.get((key_x + i, key_y + j), ()):
+                    if not used[candidate // 2] and \
+                       coincident(points[candidate], points[point]):
+                        return candidate
+            return -1
+
+        loops = []
+        unmatched = []
+        loop = self.loop_buffer
+        for edge_num in range(len(edges)):
+            if used[edge_num]:
+                continue
+            used[edge_num] = True
+            start, end = 2 * edge_num, 2 * edge_num + 1
+            loop.clear()
+            loop.append([*points[start], z, *points[end], z])
+            previous = start
+            while not coincident(points[end], points[start]):
+                found = next_endpoint(end)
+                if found == -1:
+                    unmatched += [points[start], points[end]]
+                    break
+                used[found // 2] = True
+                #The other end point of the edge that was found
+                other = found ^ 1
+                #A duplicate of the last edge running in the same direction
+                #is found by its end point (odd)
+                if found % 2 == 1 and \
+                   coincident(points[other], points[previous]):
+                    continue
+                loop.append([*points[found], z, *points[other], z])
+                previous, end = found, other
+            else:
+                #An edge and its reverse close a loop without an area
+                if len(loop) > 2:
+                    loops += [loop.copy()]
+        self.unmatched_endpoints = np.array(unmatched).reshape(-1, 2)
+        return loops
+
     def create_loops(self, edges:np.ndarray) -> (list, list):
         """
         Returns two lists of arrays of closed loops that are organized based
         on the type of region the loop encloses
         """
+        loops = self.stitch_loops(edges)
+        if len(self.unmatched_endpoints) != 0:
+            return "error"
+        """
+        Every edge is oriented with the inside of the mesh on its left (see
+        orient_edges) so the loops enclosing the inside of the mesh run 
+        counterclockwise and the loops enclosing free space (holes) run 
+        clockwise. The type of region is given by the sign of the area of 
+        the loop:
+            area > 0: encloses the inside of the mesh
+            area < 0: encloses free space
+        Both lists are ordered from the largest to the smallest area.
+        
+        The loops and their areas are kept so they can be grouped into 
+        islands when they are needed (see islands).
+        """
+        areas = self.signed_areas(loops)
+        order = np.argsort(-abs(areas), kind = "stable")
+        enclosed_region_mesh = [loops[i] for i in order if areas[i] > 0]
+        enclosed_region_free = [loops[i] for i in order if areas[i] <= 0]
+        
+        self.loops = loops
+        self.loop_areas = areas
+        return enclosed_region_mesh, enclosed_region_free
+    
+    def islands(self) -> list:
+        """
+        Returns the loops of the last layer passed to create_loops grouped
+        by island, from the largest to the smallest. Each island is a list 
+        holding a loop enclosing the inside of the mesh followed by the 
+        holes directly inside of it. Holes that are not directly inside a
+        loop enclosing the mesh are placed last, each on its own, so every
+        loop is returned.
+        """
+        loops, areas = self.loops, self.loop_areas
+        parents, children = self.island_tree(loops, areas)
+        order = np.argsort(-abs(areas), kind = "stable")
+        islands = [[loops[i]] + [loops[j] for j in children[i] if areas[j] <= 0] 
+                   for i in order if areas[i] > 0]
+        islands += [[loops[i]] for i in order if areas[i] <= 0 and 
+                    (parents[i] == -1 or areas[parents[i]] <= 0)]
+        return islands
+    
+    def island_tree(self, loops:list, 
+                    areas:np.ndarray = None) -> (np.ndarray, list):
+        """
+        Returns the parent of every loop, which is the smallest loop that
+        encloses it (-1 if no loop encloses it), and the list of children
+        of every loop.
+        
+        A loop can only be enclosed by a loop with a larger area whose 
+        bounding box contains its bounding box, and so contains the lower
+        corner of its bounding box. The bounding boxes are indexed with a
+        uniform grid: every box is registered in the cells it covers, so 
+        the loops that can enclose a loop are the ones registered in the 
+        cell of its lower corner. The cells are sized so there are about 
+        as many cells as loops, and every (loop, candidate) pair is found
+        and filtered by the bounds and areas at once. The candidates of 
+        each loop are then checked from the smallest to the largest area 
+        with point_in_loop. The signed areas of the loops are computed if
+        they are not given.
+        """
+        num_loops = len(loops)
+        parents = np.full(num_loops, -1)
+        children = [[] for i in range(num_loops)]
+        if num_loops < 2:
+            return parents, children
+        
+        if areas is None:
+            areas = self.signed_areas(loops)
+        areas = abs(areas)
+        edges = np.concatenate(loops)
+        starts = np.cumsum([0] + [len(loop) for loop in loops[:-1]])
+        lower = np.stack((np.minimum.reduceat(np.minimum(edges[:, 0], edges[:, 3]), starts),
+                          np.minimum.reduceat(np.minimum(edges[:, 1], edges[:, 4]), starts)), 
+                         axis = 1)
+        upper = np.stack((np.maximum.reduceat(np.maximum(edges[:, 0], edges[:, 3]), starts),
+                          np.maximum.reduceat(np.maximum(edges[:, 1], edges[:, 4]), starts)), 
+                         axis = 1)
+        
+        #Cells of the grid covered by every bounding box
+        origin = np.amin(lower, axis = 0)
+        span = np.amax(upper, axis = 0) - origin
+        cell_size = max(np.amax(span) / np.sqrt(num_loops), self.epsilon)
+        num_cells = np.floor(span / cell_size).astype(np.int64) + 1
+        first_cell = np.floor((lower - origin) / cell_size).astype(np.int64)
+        last_cell = np.floor((upper - origin) / cell_size).astype(np.int64)
+        first_cell = np.minimum(first_cell, num_cells - 1)
+        last_cell = np.minimum(last_cell, num_cells - 1)
+        cells_x = last_cell[:, 0] - first_cell[:, 0] + 1
+        cells_y = last_cell[:, 1] - first_cell[:, 1] + 1
+        
+        #Every (cell, loop) registration, sorted by cell
+        counts = cells_x * cells_y
+        owner = np.repeat(np.arange(num_loops), counts)
+        offset = np.arange(len(owner)) - np.repeat(np.cumsum(counts) - counts, 
+                                                   counts)
+        cell_x = first_cell[owner, 0] + offset // cells_y[owner]
+        cell_y = first_cell[owner, 1] + offset % cells_y[owner]
+        cell = cell_x * num_cells[1] + cell_y
+        order = np.argsort(cell, kind = "stable")
+        cell, owner = cell[order], owner[order]
+        
+        #Candidates of every loop from the cell of its lower corner
+        query = first_cell[:, 0] * num_cells[1] + first_cell[:, 1]
+        begin = np.searchsorted(cell, query, side = "left")
+        end = np.searchsorted(cell, query, side = "right")
+        counts = end - begin
+        loop = np.repeat(np.arange(num_loops), counts)
+        candidate = owner[np.arange(len(loop)) - np.repeat(np.cumsum(counts) - 
+                                                           counts, counts) + 
+                          np.repeat(begin, counts)]
+        possible = np.all(lower[candidate] <= lower[loop], axis = 1) & \
+                   np.all(upper[candidate] >= upper[loop], axis = 1) & \
+                   (areas[candidate] > areas[loop])
+        loop, candidate = loop[possible], candidate[possible]
+        
+        #Candidates of every loop from the smallest to the largest area
+        order = np.lexsort((areas[candidate], loop))
+        loop, candidate = loop[order], candidate[order]
+        bounds = np.searchsorted(loop, np.arange(num_loops + 1))
+        for i in range(num_loops):
+            for j in candidate[bounds[i]:bounds[i + 1]]:
+                if self.point_in_loop(loops[i][0][:2], loops[j]):
+                    parents[i] = j
+                    children[j] += [i]
+                    break
+        return parents, children
+    
+    def point_in_loop(self, point:np.ndarray, loop:np.ndarray) -> bool:
+        """
+        Returns True if the point is inside the loop. A ray is cast from 
+        the point in the positive x direction and the edges of the loop it
+        crosses are counted in one pass. The point is inside the loop if 
+        the ray crosses an odd number of edges.
+        """
+        x_1, y_1 = loop[:, 0], loop[:, 1]
+        x_2, y_2 = loop[:, 3], loop[:, 4]
+        crossing = (y_1 > point[1]) != (y_2 > point[1])
+        x_1, y_1 = x_1[crossing], y_1[crossing]
+        x_2, y_2 = x_2[crossing], y_2[crossing]
+        x = x_1 + (point[1] - y_1) * (x_2 - x_1) / (y_2 - y_1)
+        return np.sum(x > point[0]) % 2 == 1
+    
+    def signed_areas(self, loops:list) -> np.ndarray:
+        """
+        Returns the signed area of every loop found with the shoelace 
+        formula in one pass over the edges of all the loops:
+            area = 1/2 * sum(x_1 * y_2 - x_2 * y_1)
+        """
+        if len(loops) == 0:
+            return np.array([])
+        edges = np.concatenate(loops)
+        starts = np.cumsum([0] + [len(loop) for loop in loops[:-1]])
+        terms = edges[:, 0] * edges[:, 4] - edges[:, 3] * edges[:, 1]
+        return np.add.reduceat(terms, starts) / 2
+    
+    def offset_loops(self, wall_line_count:int, enclosed_region_mesh:list, 
+                     enclosed_region_free:list) -> list:
+        """
+        Returns a list with an array of the loops of every wall. Wall i is 
+        found by offsetting every loop towards the inside of the mesh by
+            d = i * nozzle_diameter
+        so the first wall follows the loops themselves.
+        
+        Every edge is oriented with the inside of the mesh on its left (see
+        orient_edges) so the loops enclosing the inside of the mesh shrink
+        and the loops enclosing a free region grow when every edge is moved
+        to its left (see offset_polygons). Moving the edges makes loops 
+        cross themselves and each other wherever the mesh is narrower than
+        2 * d, and those crossings are trimmed away (see trim_polygons).
+        
+        A wall that has no loops left after trimming does not fit inside 
+        the mesh, so it and the walls after it are dropped and their number
+        is stored in self.collapsed_walls.
+        """
+        self.collapsed_walls = 0
+        loops = enclosed_region_free + enclosed_region_mesh
+        
+        #Edges shorter than epsilon have no direction
+        loops = [loop[np.hypot(loop[:, 3] - loop[:, 0], 
+                               loop[:, 4] - loop[:, 1]) > self.epsilon] 
+                 for loop in loops]
+        loops = [loop for loop in loops if len(loop) > 2]
+        if len(loops) == 0:
+            return []
+        edges = np.concatenate(loops)
+        lengths = np.array([len(loop) for loop in loops])
         z = edges[0][2]
-        loop_dict = dict()
-        loop_num = 1
-        failsafe_threshold = 2 * len(edges)
-        while len(edges) != 0:
-            failsafe_counter = 0
-            loop = np.array([[edges[0][0], edges[0][1], z, 
-                              edges[0][3], edges[0][4], z]])
-            delete_index = [0]
-            while not(abs(loop[0][0] - loop[-1][-3]) < self.epsilon) or \
-                  not(abs(loop[0][1] - loop[-1][-2]) < self.epsilon):
-                #Exit loop if no closed loop can be found
-                failsafe_counter += 1
-                if failsafe_counter > failsafe_threshold:
-                    return "error"
-                edges = np.delete(edges, tuple(delete_index), 0)
-                delete_index = []
-                for i in range(len(edges)):
-                    y_3, y_2, y_1 = edges[i][1],\
-                                    edges[i][4],\
-                                    loop[-1][-2]
-                    x_3, x_2, x_1 = edges[i][0],\
-                                    edges[i][3],\
-                                    loop[-1][-3]
-                    if False not in abs(edges[i] - loop[-1]) < self.epsilon:
-                        delete_index += [i]
-                    elif (abs(x_2 - x_1) < self.epsilon) and \
-                         (abs(y_2 - y_1) < self.epsilon):
-                        loop = np.append(loop, np.array([[x_2, y_2, z, 
-                                                          x_3, y_3, z]]), 
-                                                          axis = 0)
-                        delete_index += [i]
-                    elif (abs(x_3 - x_1) < self.epsilon) and \
-                         (abs(y_3 - y_1) < self.epsilon):
-                        loop = np.append(loop, np.array([[x_3, y_3, z, 
-                                                          x_2, y_2, z]]), 
-                                                          axis=0)
-                        delete_index += [i]
-            loop_dict.update({loop_num: loop})
-            loop_num += 1
-            edges = np.delete(edges, tuple(delete_index), 0)
-        """
-        Now that all the loops of the mesh are found the purpose of the
-        next portion of the method is to determine which loops enclose the
-        inside of the mesh and which loops enclose free space(holes).
-        
-        For each loop a tuple containing the key for the loop in the 
-        loop_dict, the min and max x and y values and the area of the 
-        rectangle with edges that pass through the min and max values is
-        placed is a list that is ordered based on which loop encloses
-        a region with the largest area.
-        
-        Note: The area is grossly approximated.
-        
-        loops are sorted into a dictionary starting with the loop
-        the largest area. If the min and max x and y values of a loop  
-        with a smaller area is in between the min and max x and y values of
-        a loop with a larger area, the smaller loop will be grouped with
-        the larger loop meaning the smaller loop is inside the larger
-        loop. If the loop with the smaller area is not inside
-        the loop with the larger area is assigned to a new group. 
-        the next loops will now also be compared with the old and new group
-        to see if it lies inside a loop.
-        """
-        for key in loop_dict:
-            rows = np.split(np.repeat(np.arange(len(loop_dict[key])),2), 
-                                                len(loop_dict[key]))
-            x_columns = np.array([np.arange(0, 6, 3),]*len(loop_dict[key]))
-            y_columns = np.array([np.arange(1, 6, 3),]*len(loop_dict[key]))
-            x_min = np.amin(loop_dict[key][rows, x_columns])
-            x_max = np.amax(loop_dict[key][rows, x_columns])
-            y_min = np.amin(loop_dict[key][rows, y_columns])
-            y_max = np.amax(loop_dict[key][rows, y_columns])
-            area = abs((y_max - y_min) * (x_max - x_min))
-            if key == 1:
-                key_order = [(key, area, x_min, x_max, y_min, y_max)]
+        
+        walls = [edges]
+        for i in range(1, wall_line_count):
+            points, loop_lengths = self.offset_polygons(
+                edges, lengths, i * self.nozzle_diameter)
+            wall = self.trim_polygons(points, loop_lengths, z)
+            if len(wall) == 0:
+                self.collapsed_walls = wall_line_count - i
+                break
+            walls += [np.concatenate(wall)]
+        return walls
+    
+    def offset_polygons(self, edges:np.ndarray, lengths:np.ndarray, 
+                        d:float) -> (np.ndarray, np.ndarray):
+        """
+        Returns the vertices of the loops offset by d to the left of their
+        edges as an (N, 2) array and the number of vertices of every loop.
+        
+        Every edge is moved by d along its left normal n. At the vertex p 
+        joining an edge with direction u_1 and left normal n_1 to an edge 
+        with direction u_2 and left normal n_2:
+            - If the loop turns left (u_1 x u_2 > 0) the moved edges cross 
+              each other before reaching the corner and are joined through
+              the corner itself:
+                  p + d * n_1, p, p + d * n_2
+              The small loop this forms around the corner runs clockwise 
+              and is trimmed away. Joining through the corner makes every
+              edge and its moved copy enclose the band of points closer 
+              than d to the edge even when the edges are shorter than d.
+            - If the loop turns right the moved edges do not reach each 
+              other and are joined at the miter point:
+                  p' = p + d * (n_1 + n_2) / (1 + n_1 . n_2)
+              while the miter is at most 2 * d long:
+                  1 + n_1 . n_2 >= 0.5
+              At sharper corners the moved edges are extended by d past 
+              the corner and joined with a square end:
+                  p + d * (n_1 + u_1), p + d * (n_2 - u_2)
+        Nearly straight corners (u_1 x u_2 < 0.001) are always joined at 
+        the miter point.
+        The vertices of all the loops are found in one pass.
+        """
+        starts = np.cumsum(lengths) - lengths
+        
+        #Index of the previous edge of every edge in its loop
+        previous = np.arange(len(edges)) - 1
+        previous[starts] += lengths
+        
+        direction = edges[:, 3:5] - edges[:, 0:2]
+        direction /= np.linalg.norm(direction, axis = 1)[:, np.newaxis]
+        normal = np.stack((-direction[:, 1], direction[:, 0]), axis = 1)
+        direction_previous = direction[previous]
+        normal_previous = normal[previous]
+        cos_angle = np.sum(normal * normal_previous, axis = 1)
+        turn = direction_previous[:, 0] * direction[:, 1] - \
+               direction_previous[:, 1] * direction[:, 0]
+        
+        #Every vertex is replaced by up to 3 vertices
+        p = edges[:, 0:2]
+        joins = np.empty((len(edges), 3, 2))
+        counts = np.ones(len(edges), dtype = np.int64)
+        left = turn > 0.001
+        miter = ~left & (1 + cos_angle >= 0.5)
+        square = ~left & ~miter
+        joins[left, 0] = p[left] + d * normal_previous[left]
+        joins[left, 1] = p[left]
+        joins[left, 2] = p[left] + d * normal[left]
+        counts[left] = 3
+        joins[miter, 0] = p[miter] + d * (normal + normal_previous)[miter] / \
+                          (1 + cos_angle[miter])[:, np.newaxis]
+        joins[square, 0] = p[square] + d * (normal_previous + 
+                                            direction_previous)[square]
+        joins[square, 1] = p[square] + d * (normal - direction)[square]
+        counts[square] = 2
+        
+        points = joins[np.arange(3) < counts[:, np.newaxis]]
+        return points, np.add.reduceat(counts, starts)
+    
+    def segment_crossings(self, p:np.ndarray, q:np.ndarray) -> tuple:
+        """
+        Returns the pairs of segments (p_i, q_i) and (p_j, q_j) that cross
+        each other as the arrays i and j, the parameters t_i and t_j of the
+        crossing along each segment and the crossing points.
+        
+        The segments are sorted by their lower bound along the axis with 
+        the largest span so the segments that can cross segment i are the 
+        ones after it whose lower bound is at most the upper bound of 
+        segment i. Every such pair is generated at once by repeating each 
+        segment over its range. The pairs whose bounds along the other axis
+        also overlap are solved with r = q_i - p_i, s = q_j - p_j:
+            p_i + t_i * r = p_j + t_j * s
+            t_i = ((p_j - p_i) x s) / (r x s)
+            t_j = ((p_j - p_i) x r) / (r x s)
+        and cross if 0 < t_i < 1 and 0 < t_j < 1. Segments that only touch
+        at their end points, like neighbouring edges of a loop, do not 
+        cross.
+        """
+        lower, upper = np.minimum(p, q), np.maximum(p, q)
+        axis = np.argmax(np.amax(upper, axis = 0) - np.amin(lower, axis = 0))
+        other = 1 - axis
+        order = np.argsort(lower[:, axis], kind = "stable")
+        sorted_lower = lower[order, axis]
+        ends = np.searchsorted(sorted_lower, upper[order, axis], side = "right")
+        counts = np.maximum(ends - np.arange(len(p)) - 1, 0)
+        
+        #Every pair of segments whose bounds along the axis overlap
+        first = np.repeat(np.arange(len(p)), counts)
+        second = np.arange(len(first)) - np.repeat(np.cumsum(counts) - counts, 
+                                                   counts) + first + 1
+        i, j = order[first], order[second]
+        overlap = (lower[i, other] <= upper[j, other]) & \
+                  (lower[j, other] <= upper[i, other])
+        i, j = i[overlap], j[overlap]
+        
+        r, s, pq = q[i] - p[i], q[j] - p[j], p[j] - p[i]
+        denominator = r[:, 0] * s[:, 1] - r[:, 1] * s[:, 0]
+        parallel = denominator == 0
+        denominator[parallel] = 1
+        t_i = (pq[:, 0] * s[:, 1] - pq[:, 1] * s[:, 0]) / denominator
+        t_j = (pq[:, 0] * r[:, 1] - pq[:, 1] * r[:, 0]) / denominator
+        tolerance = 1e-9
+        crossing = ~parallel & (t_i > tolerance) & (t_i < 1 - tolerance) & \
+                   (t_j > tolerance) & (t_j < 1 - tolerance)
+        i, j, t_i, t_j = i[crossing], j[crossing], t_i[crossing], t_j[crossing]
+        points = p[i] + t_i[:, np.newaxis] * r[crossing]
+        return i, j, t_i, t_j, points
+    
+    def trim_polygons(self, points:np.ndarray, lengths:np.ndarray, 
+                      z:float) -> list:
+        """
+        Returns a list of arrays of the closed loops bounding the region 
+        that the polygons wind around a positive number of times, where the
+        polygons are given by their vertices and the number of vertices of
+        each polygon.
+        
+        The edges are split at every point where they cross (see 
+        segment_crossings). The winding number w of the region to the 
+        right of a piece of an edge only changes where the edge crosses
+        another edge s. The region to the left of s winds once more than
+        the region to its right, so moving along an edge with direction u
+        past the crossing changes w by:
+            sign(s x u)
+        The winding number to the right of one piece of every polygon is 
+        counted by casting a ray from a point just to its right (see 
+        winding_numbers) and the changes are added up along the rest of the
+        polygon. A piece is on the boundary of the region, with the region 
+        on its left, if:
+            w = 0
+        The pieces that are kept are joined end to end into loops (see 
+        stitch_loops).
+        """
+        starts = np.cumsum(lengths) - lengths
+        following = np.arange(len(points)) + 1
+        following[starts + lengths - 1] = starts
+        p, q = points, points[following]
+        polygon = np.repeat(np.arange(len(lengths)), lengths)
+        i, j, t_i, t_j, crossings = self.segment_crossings(p, q)
+        r = q - p
+        change = np.sign(r[j, 0] * r[i, 1] - r[j, 1] * r[i, 0])
+        
+        #The start points and crossings of every edge, ordered along the
+        #polygons. Piece k runs from node k to the next node of its edge.
+        node_edge = np.concatenate((np.arange(len(p)), i, j))
+        node_t = np.concatenate((np.zeros(len(p)), t_i, t_j))
+        node_point = np.concatenate((p, crossings, crossings))
+        node_change = np.concatenate((np.zeros(len(p)), change, -change))
+        order = np.lexsort((node_t, node_edge))
+        node_edge, node_point = node_edge[order], node_point[order]
+        node_change = node_change[order]
+        last = np.append(node_edge[1:] != node_edge[:-1], True)
+        node_end = np.empty_like(node_point)
+        node_end[:-1] = node_point[1:]
+        node_end[last] = q[node_edge[last]]
+        node_polygon = polygon[node_edge]
+        
+        #Winding number to the right of every piece relative to the first
+        #piece of its polygon
+        winding = np.cumsum(node_change)
+        polygon_starts = np.searchsorted(node_polygon, np.arange(len(lengths)))
+        winding -= np.repeat(winding[polygon_starts], np.diff(
+            np.append(polygon_starts, len(node_polygon))))
+        
+        #The longest piece of every polygon is used to count its winding
+        #number
+        piece = node_end - node_point
+        piece_lengths = np.hypot(piece[:, 0], piece[:, 1])
+        longest = np.lexsort((-piece_lengths, node_polygon))[polygon_starts]
+        direction = piece[longest] / piece_lengths[longest][:, np.newaxis]
+        right = (node_point[longest] + node_end[longest]) / 2 + \
+                self.epsilon * np.stack((direction[:, 1], -direction[:, 0]), 
+                                        axis = 1)
+        base = self.winding_numbers(right, p, q) - winding[longest]
+        winding += np.repeat(base, np.diff(
+            np.append(polygon_starts, len(node_polygon))))
+        
+        kept = (winding == 0) & (piece_lengths > self.epsilon)
+        if not np.any(kept):
+            return []
+        pieces = np.empty((np.sum(kept), 6))
+        pieces[:, 0:2] = node_point[kept]
+        pieces[:, 3:5] = node_end[kept]
+        pieces[:, 2] = pieces[:, 5] = z
+        
+        unmatched_endpoints = self.unmatched_endpoints
+        loops = self.stitch_loops(pieces)
+        self.unmatched_endpoints = unmatched_endpoints
+        return loops
+    
+    def winding_numbers(self, points:np.ndarray, p:np.ndarray, 
+                        q:np.ndarray) -> np.ndarray:
+        """
+        Returns the winding number of the edges (p, q) around every point.
+        A ray is cast from every point in the positive x direction and the 
+        edges it crosses are counted, +1 for an edge going up and -1 for an
+        edge going down:
+            going up:    p_y <= y < q_y and (q - p) x (point - p) > 0
+            going down:  q_y <= y < p_y and (q - p) x (point - p) < 0
+        """
+        x, y = points[:, np.newaxis, 0], points[:, np.newaxis, 1]
+        side = (q[:, 0] - p[:, 0]) * (y - p[:, 1]) - \
+               (q[:, 1] - p[:, 1]) * (x - p[:, 0])
+        up = (p[:, 1] <= y) & (y < q[:, 1]) & (side > 0)
+        down = (q[:, 1] <= y) & (y < p[:, 1]) & (side < 0)
+        return np.sum(up, axis = 1) - np.sum(down, axis = 1)
+    
+    def scanline_segments(self, loops:np.ndarray, orientation:float, 
+                          spacing:float, 
+                          aligned:bool = False) -> (np.ndarray, np.ndarray):
+        """
+        Returns an (K, 6) array of the line segments that fill the inside of
+        the loops with lines at an angle "orientation" (degrees) from the 
+        x-axis and "spacing" apart, ordered by scanline and then along the
+        line, and the scanline number of every segment.
+        
+        The edges are rotated by -orientation into the fill frame where the
+        lines are horizontal:
+            y = y_min + k * spacing
+        The edges are sorted by their lower bound. An edge is active on the
+        scanlines with
+            y_low <= y < y_high
+        which form a contiguous range of k, so the active edge table of 
+        every scanline is found at once by repeating each edge over its 
+        range. Horizontal edges are never active. Sorting the crossings by
+        scanline and x gives the bounds of every line, and every second 
+        interval is inside the mesh.
+        
+        If "aligned" the scanlines are placed on multiples of the spacing 
+        instead of starting from y_min, so the lines of every layer line up.
+        """
+        theta = orientation * np.pi / 180
+        cos, sin = np.cos(theta), np.sin(theta)
+        x = loops[:, 0::3] * cos + loops[:, 1::3] * sin
+        y = loops[:, 1::3] * cos - loops[:, 0::3] * sin
+        z = loops[0][2]
+        
+        #Edge table ordered by the lower bound of every edge
+        lower = np.argmin(y, axis = 1)
+        rows = np.arange(len(loops))
+        x_low, y_low = x[rows, lower], y[rows, lower]
+        x_high, y_high = x[rows, 1 - lower], y[rows, 1 - lower]
+        order = np.argsort(y_low, kind = "stable")
+        x_low, y_low = x_low[order], y_low[order]
+        x_high, y_high = x_high[order], y_high[order]
+        
+        #Range of scanlines crossing each edge
+        y_min, y_max = np.amin(y), np.amax(y)
+        if aligned:
+            y_min = np.floor(y_min / spacing) * spacing
+            num_lines = int(np.ceil((y_max - y_min) / spacing)) + 1
+        else:
+            num_lines = int(round((y_max - y_min) / spacing))
+        first = np.clip(np.ceil((y_low - y_min) / spacing), 1, num_lines)
+        last = np.clip(np.ceil((y_high - y_min) / spacing), 1, num_lines)
+        counts = (last - first).astype(np.int64)
+        counts[counts < 0] = 0
+        
+        #Crossings of every active edge with its scanlines
+        edge_index = np.repeat(np.arange(len(counts)), counts)
+        line_index = np.arange(np.sum(counts)) - \
+                     np.repeat(np.cumsum(counts) - counts, counts) + \
+                     np.repeat(first.astype(np.int64), counts)
+        y_line = y_min + line_index * spacing
+        slope = (x_high - x_low) / np.where(y_high > y_low, 
+                                            y_high - y_low, 1)
+        x_line = x_low[edge_index] + \
+                 (y_line - y_low[edge_index]) * slope[edge_index]
+        
+        #Pair the crossings of each scanline
+        crossing_order = np.lexsort((x_line, line_index))
+        x_line, y_line = x_line[crossing_order], y_line[crossing_order]
+        line_index = line_index[crossing_order]
+        lines, line_starts, line_counts = np.unique(line_index, 
+                                                    return_index = True, 
+                                                    return_counts = True)
+        
+        #Lines with an odd number of crossings lose their last crossing
+        keep = np.ones(len(line_index), dtype = bool)
+        keep[(line_starts + line_counts - 1)[line_counts % 2 == 1]] = False
+        x_line, y_line = x_line[keep], y_line[keep]
+        line_index = line_index[keep]
+        
+        x_1, y_1 = x_line[0::2], y_line[0::2]
+        x_2, y_2 = x_line[1::2], y_line[1::2]
+        segments = np.empty((len(x_1), 6))
+        segments[:, 0] = x_1 * cos - y_1 * sin
+        segments[:, 1] = x_1 * sin + y_1 * cos
+        segments[:, 3] = x_2 * cos - y_2 * sin
+        segments[:, 4] = x_2 * sin + y_2 * cos
+        segments[:, 2] = z
+        segments[:, 5] = z
+        return segments, line_index[0::2]
+    
+    def order_segments(self, segments:np.ndarray, lines:np.ndarray, 
+                       orientation:float) -> np.ndarray:
+        """
+        Returns the segments of scanline_segments ordered into a tool path.
+        
+        The segments are first split into regions. A segment continues the
+        region of the segment on the previous scanline if they are the only
+        segments of their scanlines that overlap each other, otherwise it
+        starts a new region. The overlaps are found with binary searches
+        since the segments of a scanline are sorted and do not overlap. 
+        Each region is printed back and forth (boustrophedon) so every 
+        segment starts next to the end of the previous one.
+        
+        Regions can be entered at either end of their first or last 
+        segment. After each region the region with the closest entry point
+        is printed next, found with a grid of the entry points (see 
+        point_grid).
+        """
+        if len(segments) == 0:
+            return segments
+        theta = orientation * np.pi / 180
+        cos, sin = np.cos(theta), np.sin(theta)
+        low = segments[:, 0] * cos + segments[:, 1] * sin
+        high = segments[:, 3] * cos + segments[:, 4] * sin
+        
+        #Region of every segment
+        line_numbers, line_starts = np.unique(lines, return_index = True)
+        line_ends = np.append(line_starts[1:], len(segments))
+        region = np.empty(len(segments), dtype = np.int64)
+        num_regions = 0
+        previous = slice(0, 0)
+        previous_line = None
+        for line, start, end in zip(line_numbers, line_starts, line_ends):
+            labels = np.full(end - start, -1)
+            if previous_line == line - 1:
+                low_1, high_1 = low[previous], high[previous]
+                low_2, high_2 = low[start:end], high[start:end]
+                first_1 = np.searchsorted(high_1, low_2, side = "right")
+                count_1 = np.searchsorted(low_1, high_2, side = "left") - first_1
+                first_2 = np.searchsorted(high_2, low_1, side = "right")
+                count_2 = np.searchsorted(low_2, high_1, side = "left") - first_2
+                only = count_1 == 1
+                only[only] = count_2[first_1[only]] == 1
+                labels[only] = region[previous][first_1[only]]
+            new = labels == -1
+            labels[new] = num_regions + np.arange(np.sum(new))
+            num_regions += np.sum(new)
+            region[start:end] = labels
+            previous = slice(start, end)
+            previous_line = line
+        
+        #Segments of every region in scanline order
+        members = np.argsort(region, kind = "stable")
+        region_starts = np.searchsorted(region[members], np.arange(num_regions))
+        region_ends = np.append(region_starts[1:], len(segments))
+        first = members[region_starts]
+        last = members[region_ends - 1]
+        
+        #Entry points: start and end of the first and last segment
+        entry_points = np.stack((segments[first, 0:2], segments[first, 3:5], 
+                                 segments[last, 0:2], segments[last, 3:5]), 
+                                 axis = 1)
+        grid = point_grid(entry_points.reshape(-1, 2))
+        position = segments[0, 0:2]
+        order = []
+        reverse = []
+        for i in range(num_regions):
+            next_region, entry = divmod(grid.nearest(position), 4)
+            for point in range(4 * next_region, 4 * next_region + 4):
+                grid.remove(point)
+            region_members = members[region_starts[next_region]:
+                                     region_ends[next_region]]
+            if entry >= 2:
+                region_members = region_members[::-1]
+            flip = (np.arange(len(region_members)) + entry) % 2 == 1
+            order += [region_members]
+            reverse += [flip]
+            if flip[-1]:
+                position = segments[region_members[-1], 0:2]
             else:
-                key_order += [(key, area, x_min, x_max, y_min, y_max)]   
-        key_order = sorted(key_order, key=lambda a: a[1], reverse=True)
-        key_dict = {1: [key_order[0]]}
-        del key_order[0]
-        index = []
-        counter = 1
-        while 0 != len(key_order):
-            for i in range(len(key_order)):
-                inside_loop = False
-                for key in key_dict:
-                    x_min_1 = key_dict[key][0][2]
-                    x_min_2 = key_order[i][2]
-                    x_max_1 = key_dict[key][0][3]
-                    x_max_2 = key_order[i][3]
-                    if (x_min_1 < x_min_2) and (x_max_1 > x_max_2):
-                        y_min_1 = key_dict[key][0][4]
-                        y_min_2 = key_order[i][4]
-                        y_max_1 = key_dict[key][0][5]
-                        y_max_2 = key_order[i][5]
-                        if (y_min_1 < y_min_2) and (y_max_1 > y_max_2):
-                            key_dict[key].append(key_order[i])
-                            inside_loop = True           
-                if not(inside_loop):
-                    counter += 1
-                    key_dict.update({counter: [key_order[i]]})
-                index += [i]
-            for j in sorted(index, reverse = True):
-                del key_order[j]
-            index.clear()
-        """
-        The loops will be organized based on the type of region they enclose.
-        The loop enclosing the largest area is always enclosing the inside of
-        the mesh. The algorithm will only run if there is more than one loop
-        inside the outer loop. The loops are already arranged from least to 
-        greatest area. Therefore the second loop must enclose a region that is 
-        not the inside of the mesh which is why variable region_free is initially  
-        True. The midpoint of the other loops will be calculated and if 
-        the midpoint is inside  the enclosed area of the second loop, the variable
-        loop_inside will be set to True and the other loop will be
-        kept track of. This will be repeated for the third, fourth... loops
-        
-        If there is a loop inside the outer loop, The inner loop must enclose 
-        the opposite region of the outer_loop so the inner loop will be moved to
-        the front of the list and the region_free variable is switched
-        The outer loop is added to its corresponding list and removed from 
-        the dictionary.
-        """
-        enclosed_region_mesh = []
-        enclosed_region_free = []
-        counter = 2
-        for key in key_dict:
-            region_free = True
-            loop_inside = False
-            loop = loop_dict[key_dict[key][0][0]]
-            enclosed_region_mesh += [loop]
-            if len(key_dict[key]) > 2:
-                del key_dict[key][0]
-                while len(key_dict[key]) != 0:
-                    loop = loop_dict[key_dict[key][0][0]]
-                    for i in range(1, len(key_dict[key])):
-                        x_min = key_dict[key][i][2]
-                        x_max = key_dict[key][i][3]
-                        y_min = key_dict[key][i][4]
-                        y_max = key_dict[key][i][5]
-                        midpoint = ((x_min + x_max) / 2, (y_min + y_max) / 2)
-                        for j in range(len(loop)):
-                            y_2, y_1 = (loop[j][1],
-                                        loop[j][4]) 
-                            x_2, x_1 = (loop[j][0],
-                                        loop[j][3])
-                            x_mid = midpoint[0]
-                            y_mid = midpoint[1]
-                            y_min = min(y_2, y_1)
-                            y_max = max(y_2, y_1)
-                            if (y_max >= y_mid >= y_min):
-                                for k in range(len(loop)):
-                                    if k != j: 
-                                        y_4, y_3 = (loop[k][1],
-                                                    loop[k][4]) 
-                                        x_4, x_3 = (loop[k][0],
-                                                    loop[k][3])
-                                        x_min = min(x_4, x_3, x_2, x_1)
-                                        x_max = max(x_4, x_3, x_2, x_1)
-                                        y_min = min(y_4, y_3)
-                                        y_max = max(y_4, y_3)
-                                        if (y_max >= y_mid >= y_min):
-                                            if (x_max >= x_mid >= x_min): 
-                                               loop_inside = True
-                                               loop_holder = key_dict[key][i]
-                                               loop_index = i
-                                               counter += 1
-                                               if counter > 2:
-                                                   loop_inside = False                            
-                    counter = 0
-                    if not(loop_inside):
-                        if region_free:
-                            enclosed_region_free += [loop] 
-                        else:
-                            enclosed_region_mesh += [loop]
-                        del key_dict[key][0]    
-                        region_free = True
-                    elif loop_inside:
-                        if region_free:
-                            enclosed_region_free += [loop] 
-                        else:
-                            enclosed_region_mesh += [loop]
-                        
-                        key_dict[key][0] = loop_holder
-                        del key_dict[key][loop_index]
-                        region_free = not(region_free)  
-                        loop_inside = False
-            elif len(key_dict[key]) == 2:
-                loop = loop_dict[key_dict[key][1][0]]
-                enclosed_region_free +=  [loop]
-        return enclosed_region_mesh, enclosed_region_free
+                position = segments[region_members[-1], 3:5]
+        
+        order = np.concatenate(order)
+        reverse = np.concatenate(reverse)
+        ordered_segments = segments[order]
+        ordered_segments[reverse] = np.roll(ordered_segments[reverse], 3, 
+                                            axis = 1)
+        return ordered_segments
     
-    def scale_loops(self, scaling_factor:float, enclosed_region_mesh:list, 
-                    enclosed_region_free:list) -> np.ndarray:
-        """
-        Returns an array of scaled loops that are resized based on the type of 
-        region they enclose.
-        1 <= scaling_factor < 2
-        To maintain the same dimensions while creating the wall lines
-        during print, the loops enclosing the inside of the mesh will be 
-        scaled down and the loops enclosing a free region will be scaled up.
-        """
-        for loop in enclosed_region_mesh:
-            rows = np.split(np.repeat(np.arange(len(loop)),2), len(loop))
-            x_columns = np.array([np.arange(0, 6, 3),]*len(loop))
-            y_columns = np.array([np.arange(1, 6, 3),]*len(loop))
-            x_translation = np.sum(loop[rows, x_columns]) / \
-                            np.size(loop[rows, x_columns])
-            y_translation = np.sum(loop[rows, y_columns]) / \
-                            np.size(loop[rows, y_columns])
-            loop[rows, x_columns] -= x_translation 
-            loop[rows, y_columns] -= y_translation
-            loop[rows, x_columns] *= (2 - scaling_factor)
-            loop[rows, y_columns] *= (2 - scaling_factor)
-            loop[rows, x_columns] += x_translation
-            loop[rows, y_columns] += y_translation
-        
-        for loop in enclosed_region_free:
-            rows = np.split(np.repeat(np.arange(len(loop)),2), len(loop))
-            x_columns = np.array([np.arange(0, 6, 3),]*len(loop))
-            y_columns = np.array([np.arange(1, 6, 3),]*len(loop))
-            x_translation = np.sum(loop[rows, x_columns]) / \
-                            np.size(loop[rows, x_columns])
-            y_translation = np.sum(loop[rows, y_columns]) / \
-                            np.size(loop[rows, y_columns])
-            loop[rows, x_columns] -= x_translation 
-            loop[rows, y_columns] -= y_translation
-            loop[rows, x_columns] *= scaling_factor
-            loop[rows, y_columns] *= scaling_factor
-            loop[rows, x_columns] += x_translation 
-            loop[rows, y_columns] += y_translation     
- 
-        first_pass = False
-        for i in range(len(enclosed_region_free)):
-            for j in range(len(enclosed_region_free[i])):
-                scaled_loop = np.array([enclosed_region_free[i][j]])
-                if i == 0 and j == 0:
-                    scaled_loops = scaled_loop
-                    first_pass = True
-                else:
-                    scaled_loops = np.append(scaled_loops, scaled_loop, axis = 0) 
-        for i in range(len(enclosed_region_mesh)):
-            for j in range(len(enclosed_region_mesh[i])):
-                scaled_loop = np.array([enclosed_region_mesh[i][j]])
-                if not(first_pass):
-                    scaled_loops = scaled_loop
-                    first_pass = True
-                else:
-                    scaled_loops = np.append(scaled_loops, scaled_loop, axis = 0)            
-        return scaled_loops
+    def infill_spacing(self, infill_percentage:float, 
+                       infill_pattern:str) -> float:
+        """
+        Returns the space between the lines of the infill. At 100% infill 
+        the lines are nozzle_diameter * 1.18 apart. Below 100% the spacing 
+        grows by 100 / infill_percentage, and the grid pattern prints two 
+        sets of lines so each set is twice as far apart. At 0% infill there
+        are no lines and the spacing is infinite.
+        """
+        if infill_percentage <= 0:
+            return np.inf
+        spacing = self.nozzle_diameter * 1.18
+        if infill_percentage >= 100:
+            return spacing
+        if infill_pattern == "grid":
+            spacing *= 2
+        return spacing * 100 / infill_percentage
     
-    def infill(self, loops:np.ndarray, orientation:int) -> np.ndarray:
+    def infill(self, loops:np.ndarray, orientation:float, 
+               infill_percentage:float = 100, 
+               infill_pattern:str = "rectilinear") -> np.ndarray:
         """
         Returns an array of ordered coordinates that define the 
-        tool path of the printer while printing the infill. Only
-        100% infill is supported.
-        """
-        edges = loops        
-        rows = np.split(np.repeat(np.arange(len(edges)),2),len(edges))
-        x_columns = np.array([np.arange(0, 6, 3),]*len(edges))
-        y_columns = np.array([np.arange(1, 6, 3),]*len(edges))
-        x_min = np.amin(edges[rows, x_columns])
-        x_max = np.amax(edges[rows, x_columns])
-        y_min = np.amin(edges[rows, y_columns])
-        y_max = np.amax(edges[rows, y_columns])
- 
-        spacing = self.nozzle_diameter * 1.18 #space between each path
-        
-        if orientation == 0:#0 degree
-            first_pass = True
-            num_of_y_increments = int(round((y_max - y_min) / spacing))
-            for i in range(1, num_of_y_increments):
-                line_bounds = []
-                y = y_min + i * spacing
-                for j in range(len(edges)):
-                    up_bound = max(edges[j][1], edges[j][4])
-                    low_bound = min(edges[j][1], edges[j][4])
-                    if up_bound >= y >= low_bound:
-                        y_2, y_1 = edges[j][1], edges[j][4] 
-                        x_2, x_1 = edges[j][0], edges[j][3]
-                        z = edges[j][2]
-                        if abs(x_2 - x_1) < self.epsilon:
-                            x = x_1
-                            line_bounds += [(x, y, z)]
-                        elif abs(y_2 - y_1) < self.epsilon:
-                            line_bounds += [(x_1, y, z), (x_2, y, z)]
-                        else:
-                            m = (y_2 - y_1)/ (x_2 - x_1)
-                            x = (y - y_1) / m + x_1
-                            line_bounds += [(x, y, z)]          
-                line_bounds = sorted(line_bounds, key=lambda x: x[0])
-                if line_bounds != [] and len(line_bounds) != 1:
-                    if first_pass:
-                        bounds = [line_bounds]
-                        first_pass = False
-                    else:
-                        bounds.append(line_bounds)
-                        
-        elif orientation == 90: #90 degree 
-            first_pass = True
-            num_of_x_increments = int(round((x_max - x_min) / spacing))
-            for i in range(1, num_of_x_increments):
-                line_bounds = []
-                x = x_min + i * spacing
-                for j in range(len(edges)):
-                    up_bound = max(edges[j][0], edges[j][3])
-                    low_bound = min(edges[j][0], edges[j][3])
-                    if up_bound >= x >= low_bound:
-                        y_2, y_1 = edges[j][1], edges[j][4] 
-                        x_2, x_1 = edges[j][0], edges[j][3]
-                        z = edges[j][2]
-                        if abs(x_2 - x_1) < self.epsilon:
-                            line_bounds += [(x, y_1, z), (x, y_2, z)]
-                        elif abs(y_2 - y_1) < self.epsilon:
-                            y = y_1
-                            line_bounds += [(x, y, z)]
-                        else:
-                            m = (y_2 - y_1)/ (x_2 - x_1)
-                            y = (x - x_1) * m + y_1
-                            line_bounds += [(x, y, z)]          
-                line_bounds = sorted(line_bounds, key=lambda x: x[1])
-                if line_bounds != [] and len(line_bounds) != 1:
-                    if not first_pass:
-                        bounds.append(line_bounds)
-                    else:
-                        bounds = [line_bounds]
-                        first_pass = False
-                    
-        elif orientation == 45: #45 degree
-            first_pass = True 
-            x_mid = (x_min + x_max) / 2
-            y_mid = (y_min + y_max) / 2
-            x_squared = np.square(edges[rows, x_columns] - x_mid)
-            y_squared = np.square(edges[rows, y_columns] - y_mid)
-            radius = np.amax(np.sqrt(x_squared + y_squared))
-            x_start = x_mid + radius * np.cos(3 * np.pi/4)
-            y_start = y_mid + radius * np.sin(3 * np.pi/4)
-            x_end = x_mid + radius * np.cos(-np.pi/4)
-            y_end = y_mid + radius * np.sin(-np.pi/4)
-            b = y_start - x_start
-            b_end = y_end - x_end
-            while b > b_end:
-                b -= spacing
-                line_bounds = []
-                for j in range(len(edges)):
-                    found_intersection = False
-                    up_bound_y = max(edges[j][1], edges[j][4])
-                    low_bound_y = min(edges[j][1], edges[j][4])
-                    up_bound_x = max(edges[j][0], edges[j][3])
-                    low_bound_x = min(edges[j][0], edges[j][3])
-                    y_2, y_1 = edges[j][1], edges[j][4] 
-                    x_2, x_1 = edges[j][0], edges[j][3]
-                    z = edges[j][2]
-                    if abs(x_2 - x_1) < self.epsilon:
-                        x = x_1
-                        y = x + b 
-                        intersection = (x, y, z)
-                        found_intersection = True
-                    elif abs(y_2 - y_1) < self.epsilon:
-                        y = y_1
-                        x = y - b
-                        intersection = (x, y, z)
-                        found_intersection = True
-                    else:
-                        m = (y_2 - y_1)/ (x_2 - x_1)
-                        if abs(m - 1) < self.epsilon:
-                            continue
-                        else:
-                            b_1 = y_1 - m * x_1
-                            x = (b - b_1) / (m - 1) 
-                            y = x + b
-                            intersection = (x, y, z)
-                            found_intersection = True
-                    if found_intersection:
-                        found_intersection = False
-                        if (low_bound_x <= intersection[0] <= up_bound_x) and \
-                           (low_bound_y <= intersection[1] <= up_bound_y):
-                            line_bounds += [intersection]
-                line_bounds = sorted(line_bounds, key=lambda x: x[0])
-                if line_bounds != [] and len(line_bounds) != 1:
-                    if first_pass:
-                        bounds = [line_bounds]
-                        first_pass = False
-                    else:
-                        bounds.append(line_bounds)
-                        
-        elif orientation == 135: #135 degrees
-            first_pass = True 
-            x_mid = (x_min + x_max) / 2
-            y_mid = (y_min + y_max) / 2
-            x_squared = np.square(edges[rows, x_columns] - x_mid)
-            y_squared = np.square(edges[rows, y_columns] - y_mid)
-            radius = np.amax(np.sqrt(x_squared + y_squared))
-            x_start = x_mid + radius * np.cos(np.pi/4)
-            y_start = y_mid + radius * np.sin(np.pi/4)
-            x_end = x_mid + radius * np.cos(5 * np.pi/4)
-            y_end = y_mid + radius * np.sin(5 * np.pi/4)
-            b = y_start + x_start
-            b_end = y_end + x_end
-            while b > b_end:
-                b -= spacing
-                line_bounds = []
-                for j in range(len(edges)):
-                    found_intersection = False
-                    up_bound_y = max(edges[j][1], edges[j][4])
-                    low_bound_y = min(edges[j][1], edges[j][4])
-                    up_bound_x = max(edges[j][0], edges[j][3])
-                    low_bound_x = min(edges[j][0], edges[j][3])
-                    y_2, y_1 = edges[j][1], edges[j][4] 
-                    x_2, x_1 = edges[j][0], edges[j][3]
-                    z = edges[j][2]
-                    if abs(x_2 - x_1) < self.epsilon:
-                        x = x_1
-                        y = -x + b 
-                        intersection = (x, y, z)
-                        found_intersection = True
-                    elif abs(y_2 - y_1) < self.epsilon:
-                        y = y_1
-                        x = -(y - b)
-                        intersection = (x, y, z)
-                        found_intersection = True
-                    else:
-                        m = (y_2 - y_1)/ (x_2 - x_1)
-                        if abs(m - 1) < self.epsilon:
-                            continue
-                        else:
-                            b_1 = y_1 - m * x_1
-                            x = (b - b_1) / (m + 1) 
-                            y = -x + b
-                            intersection = (x, y, z)
-                            found_intersection = True
-                    if found_intersection:
-                        found_intersection = False
-                        if (low_bound_x <= intersection[0] <= up_bound_x) and \
-                           (low_bound_y <= intersection[1] <= up_bound_y):
-                            line_bounds += [intersection]
-                            
-                line_bounds = sorted(line_bounds, key=lambda x: x[0])
-                if line_bounds != [] and len(line_bounds) != 1:
-                    if first_pass:
-                        bounds = [line_bounds]
-                        first_pass = False
-                    else:
-                        bounds.append(line_bounds)
-        """        
-        Each line_bounds must have an even number of points. It follows a 
-        pattern where every second interval defines a boundary around a region 
-        that does not enclose the inside of the mesh.
-        """
-        for i in range(len(bounds)- 1, -len(bounds) - 1, -1):
-            if len(bounds[i]) > 2:
-                for j in range(0, (len(bounds[i]) - 1), 2):
-                   bounds += [[bounds[i][j], bounds[i][j+1]]]
-                del bounds[i]
-        counter = 0
-        while len(bounds) != 0:
-            if counter == 0:
-                ordered_bounds = np.array([[bounds[0][0][0], 
-                                            bounds[0][0][1], 
-                                            bounds[0][0][2],
-                                            bounds[0][1][0], 
-                                            bounds[0][1][1], 
-                                            bounds[0][1][2]]])
-                del bounds[0]
-                counter = 1
-            else:
-                x_o = ordered_bounds[-1][3]
-                y_o = ordered_bounds[-1][4]
-                for i in range(len(bounds)):
-                    x_2, x_1 = bounds[i][1][0], bounds[i][0][0]
-                    y_2, y_1 = bounds[i][1][1], bounds[i][0][1]
-                    z_2, z_1 = bounds[i][1][2], bounds[i][0][2]
-                    l_1 = np.sqrt((x_1-x_o)**2 + (y_1-y_o)**2)
-                    l_2 = np.sqrt((x_2-x_o)**2 + (y_2-y_o)**2)
-                    if i == 0:
-                        if l_2 > l_1:
-                            l_min = l_1
-                            closest_bounds = np.array([[x_1, y_1, z_1, 
-                                                       x_2, y_2, z_2]])
-                            index = i
-                        else:
-                            l_min = l_2
-                            closest_bounds = np.array([[x_2, y_2, z_2, 
-                                                       x_1, y_1, z_1]])
-                            index = i
-                    elif l_1 < l_2:
-                        if l_min > l_1:
-                            l_min = l_1
-                            closest_bounds = np.array([[x_1, y_1, z_1, 
-                                                       x_2, y_2, z_2]])
-                            index = i
-                    else:
-                        if l_min > l_2:
-                            l_min = l_2
-                            closest_bounds = np.array([[x_2, y_2, z_2, 
-                                                       x_1, y_1, z_1]])
-                            index = i
-                ordered_bounds = np.append(ordered_bounds, closest_bounds, 
-                                                                  axis = 0)
-                del bounds[index]
-        
-        return ordered_bounds
\ No newline at end of file
+        tool path of the printer while printing the infill. The lines of 
+        the infill make an angle "orientation" (degrees) with the x-axis.
+        
+        Patterns used below 100% infill:
+            rectilinear: parallel lines at "orientation"
+            grid: lines at "orientation" and "orientation" + 90 degrees
+        Sparse lines are aligned to multiples of the spacing so the lines
+        of consecutive layers are printed on top of each other.
+        """
+        if len(loops) == 0 or infill_percentage <= 0:
+            return np.empty((0, 6))
+        spacing = self.infill_spacing(infill_percentage, infill_pattern)
+        sparse = infill_percentage < 100
+        if sparse and infill_pattern == "grid":
+            orientations = [orientation, orientation + 90]
+        else:
+            orientations = [orientation]
+        paths = []
+        for angle in orientations:
+            segments, lines = self.scanline_segments(loops, angle, spacing, 
+                                                     aligned = sparse)
+            paths += [self.order_segments(segments, lines, angle)]
+        return np.concatenate(paths)
\ No newline at end of file
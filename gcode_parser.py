@@ -22,7 +22,14 @@ Last updated: October 26, 2020
 
 #Imports
 import cylindrical_slicer as cs
+import slice_cache as sc
 import numpy as np
+import os
+import shutil
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator
 
 class gcode_parser:
     def __init__(self, gcode_file_address:str, layer_height:float, 
@@ -33,7 +40,11 @@ class gcode_parser:
                  location_x:float, location_y:float, location_z:float,
                  rotation_x:int, rotation_y:int, rotation_z:int,
                  cylinder_diameter:float, delta_y:float, filament_diameter:float,
-                 infill_orientation:int):
+                 infill_orientation:float, 
+                 infill_pattern:str = "rectilinear", 
+                 solid_layer_count:int = 3, process_count:int = 1, 
+                 cache_directory:str = None, cache_size:float = 1000,
+                 cache:sc.slice_cache = None):
         
         #User input values
         self.gcode_file_address = gcode_file_address
@@ -60,141 +71,526 @@ class gcode_parser:
         self.delta_y = delta_y
         self.filament_diameter = filament_diameter
         self.infill_orientation = infill_orientation
+        self.infill_pattern = infill_pattern
+        self.solid_layer_count = solid_layer_count
+        self.process_count = process_count
+        self.cache_directory = cache_directory
+        self.cache_size = cache_size
         
-        #Instance of slicer class
-        self.slicer = cs.cylindrical_slicer(self.stl_file_address, 
-                                            self.nozzle_diameter, 
-                                            self.rotation_x, 
-                                            self.rotation_y, 
-                                            self.rotation_z, 
-                                            self.location_x, 
-                                            self.location_y, 
-                                            self.location_z, 
-                                            self.cylinder_diameter, 
-                                            self.delta_y)
+        #Key of the model in the slice cache. The cache can be shared with
+        #the GUI so both keep track of the files the other one stores
+        self.cache = cache
+        if self.cache is None:
+            self.cache = sc.slice_cache(self.cache_directory, self.cache_size)
+        self.cache_key = self.cache.model_key(self.stl_file_address, 
+                                              self.rotation_x, 
+                                              self.rotation_y, 
+                                              self.rotation_z, 
+                                              self.location_x, 
+                                              self.location_y, 
+                                              self.location_z, 
+                                              self.cylinder_diameter, 
+                                              self.delta_y, 
+                                              self.layer_height, 
+                                              self.nozzle_diameter)
+        
+        #The slicer is only loaded if the model is not cached
+        self.slicer = None
+        max_radius = self.cache.max_radius(self.cache_key)
+        if max_radius is None:
+            self.load_slicer()
+            max_radius = self.slicer.max_radius
+            self.cache.store_max_radius(self.cache_key, max_radius)
      
         #Get the number of layers needed to print the model
-        difference = self.slicer.max_radius - (self.cylinder_diameter / 2)
+        difference = max_radius - (self.cylinder_diameter / 2)
         self.layer_count = int(difference / self.layer_height) - 1
         
         #error threshold
         self.epsilon = 0.0000001
+        
+        #Directory of the sliced toolpaths in the slice cache, a temporary
+        #directory is used while emitting the Gcode if nothing is cached
+        #(see gcode_chunks)
+        self.toolpath_address = None
+        if self.cache.enabled():
+            toolpath_key = self.cache.settings_key(self.toolpath_settings())
+            self.toolpath_address = os.path.join(
+                self.cache.entry(self.cache_key), "toolpath_" + toolpath_key)
+    
+    def load_slicer(self) -> None:
+        """
+        Creates the instance of the slicer class if it was not created yet.
+        """
+        if self.slicer is None:
+            self.slicer = cs.cylindrical_slicer(self.stl_file_address, 
+                                                self.nozzle_diameter, 
+                                                self.rotation_x, 
+                                                self.rotation_y, 
+                                                self.rotation_z, 
+                                                self.location_x, 
+                                                self.location_y, 
+                                                self.location_z, 
+                                                self.cylinder_diameter, 
+                                                self.delta_y)
           
     def create_gcode(self) -> str:
-        E = 0 # extrusion length mm
-        feed_rate_G1 = self.print_speed * 60 #mm/min
-        feed_rate_G0 = self.print_speed * 60 #mm/min
-        feed_rate_retraction = self.retraction_speed * 60 #mm/min
-        slice_orientation = self.infill_orientation #degrees
-        gcode_body = ""
-        current_layer = 0
-        print("slicing model...")
-        while current_layer < self.layer_count:
-            current_layer += 1
-            r = self.layer_height * current_layer + (self.cylinder_diameter / 2)
-            gcode_body += f";layer:{current_layer}\n"
-            
-            edges = self.slicer.gather_edges(r)
-            if str(edges) == "error":
-                print("Error: No intersection points found.")
-                return "error"
-            walls = self.slicer.create_loops(edges)
-            if str(walls) == "error":
-                print("Error: Unable to make closed loop.")
+        """
+        Returns the whole Gcode as one string. write_gcode streams the 
+        Gcode to the file instead of holding all of it in memory.
+        """
+        gcode = []
+        for chunk in self.gcode_chunks():
+            if chunk == "error":
                 return "error"
-            
-            #Print the outer and inner borders of the model    
-            for i in range(self.wall_line_count):
-                if i == 0:
-                    gcode_body += f";outer-wall\n"
-                gcode_body += f";wall:{i + 1}\n"
-                scale = 1 + i * 0.02 
-                wall = self.slicer.scale_loops(scale,
-                                               walls[0], 
-                                               walls[1])
-                previous_point = np.array([0, 0])
-                
-                for edge in wall:
-                    x_2, x_1 = (np.round(edge[3], 5), 
-                                np.round(edge[0], 5)) 
-                    y_2, y_1 = (np.round(edge[4], 5), 
-                                np.round(edge[1], 5))
-                    z_2, z_1 = (np.round(edge[5], 5), 
-                                np.round(edge[2], 5))
-                    #Retraction
-                    if ((abs(previous_point[0] - x_1) > self.epsilon) and 
-                        (abs(previous_point[1] - y_1) > self.epsilon)):
-                        gcode_body += ("G92 E0\n"+
-                                       f"G1 E-{self.retraction_length} F{feed_rate_retraction}\n")
-                        gcode_body += (f"G0 F{feed_rate_G0} " + 
-                                       f"X{x_1} Y{y_1} Z{z_1}\n")
-                        gcode_body += (f"G1 E0.1200 F{feed_rate_retraction}\n" +
-                                        "G92 E0\n")
-                        E = 0
-                    distance = np.sqrt((y_2 - y_1) ** 2 + (x_2 - x_1) ** 2)
-                    volume = distance * self.layer_height * self.nozzle_diameter
-                    E += volume / (self.filament_diameter ** 2)
-                    gcode_body += (f"G1 F{feed_rate_G1} " +
-                                   f"X{x_2} Y{y_2} Z{z_2} E{E}\n")
-                    previous_point = np.array([x_2, y_2])
-                    
-            #Alternate the slice orientation     
-            if (slice_orientation == 0) or (slice_orientation == 45):
-                slice_orientation += 90
+            gcode += [chunk]
+        return "".join(gcode)
+    
+    def gcode_chunks(self) -> Iterator[str]:
+        """
+        Generator that yields the Gcode in order: the header and start 
+        Gcode, the Gcode of every layer and the end Gcode. The model is 
+        sliced into the toolpath file first unless the same model was 
+        already sliced with the same settings and is in the slice cache, in 
+        which case only the Gcode is emitted again. Yields "error" and stops
+        if a layer can not be sliced. Without a slice cache the toolpath 
+        file is written to a temporary directory that is removed once the 
+        Gcode is emitted.
+        """
+        if self.toolpath_is_current():
+            print("Reusing the sliced toolpaths...")
+            yield from self.emit_chunks()
+            return
+        if not self.cache.enabled():
+            self.toolpath_address = tempfile.mkdtemp(prefix = "toolpath_")
+        try:
+            if self.slice_toolpaths() == "error":
+                yield "error"
+                return
+            yield from self.emit_chunks()
+        finally:
+            if not self.cache.enabled():
+                shutil.rmtree(self.toolpath_address, ignore_errors = True)
+    
+    def toolpath_settings(self) -> np.ndarray:
+        """
+        Returns the settings that change the toolpaths but not the slices 
+        of the model as an array of strings. The print settings 
+        (temperature, speeds, retraction, filament and the start and end 
+        Gcode) only change the emitted Gcode.
+        """
+        settings = [self.wall_line_count, self.infill_percentage, 
+                    self.infill_orientation, self.infill_pattern, 
+                    self.solid_layer_count]
+        return np.array([str(setting) for setting in settings])
+    
+    def toolpath_is_current(self) -> bool:
+        """
+        Returns True if the toolpath file was completely sliced with the 
+        current toolpath settings.
+        """
+        if not self.cache.enabled():
+            return False
+        settings_address = os.path.join(self.toolpath_address, "settings.npy")
+        if not os.path.isfile(settings_address):
+            return False
+        return np.array_equal(np.load(settings_address), 
+                              self.toolpath_settings())
+    
+    def slice_toolpaths(self) -> str:
+        """
+        Slices the model and writes the toolpaths to the toolpath file, a 
+        directory of .npy arrays:
+            radii:         (L,) radius of every layer
+            layer_offsets: (L + 1,) the paths of layer l are 
+                           layer_offsets[l] to layer_offsets[l + 1], the 
+                           walls from the outer wall inwards and the infill
+                           as the last path
+            path_offsets:  (P + 1,) the moves of path p are 
+                           path_offsets[p] to path_offsets[p + 1]
+            moves:         (M, 6) start and end point of every move
+            breaks:        (M,) how every move is reached, see plan_path
+            settings:      the toolpath settings, see toolpath_settings
+        The moves are written to disk as every layer is sliced. The settings
+        are written last so an incomplete toolpath file is never reused. 
+        Returns "error" and removes the toolpath file if a layer can not be
+        sliced.
+        """
+        self.load_slicer()
+        os.makedirs(self.toolpath_address, exist_ok = True)
+        settings_address = os.path.join(self.toolpath_address, "settings.npy")
+        if os.path.isfile(settings_address):
+            os.remove(settings_address)
+        moves_file = array_file(os.path.join(self.toolpath_address, 
+                                             "moves.npy"), (6,))
+        breaks_file = array_file(os.path.join(self.toolpath_address, 
+                                              "breaks.npy"), (), np.int8)
+        layer_offsets = [0]
+        path_offsets = [0]
+        
+        print("slicing model...")
+        layers = np.arange(1, self.layer_count + 1)
+        try:
+            for current_layer, toolpath in zip(layers, self.toolpaths()):
+                if isinstance(toolpath, str):
+                    print(toolpath)
+                    break
+                wall_rings, infill, spacing = toolpath
+                paths = [self.plan_path(wall) for wall in wall_rings]
+                paths += [self.plan_path(infill, spacing)]
+                for moves, breaks in paths:
+                    moves_file.append(moves)
+                    breaks_file.append(breaks)
+                    path_offsets += [path_offsets[-1] + len(moves)]
+                layer_offsets += [layer_offsets[-1] + len(paths)]
+                print("layer:", current_layer,"/", self.layer_count)
             else:
-                slice_orientation -= 90
-            
-            infill = self.slicer.infill(wall, slice_orientation) 
-            gcode_body += ";infill\n"
-            previous_line_bounds = np.array([0, 0])
-            for line_bound in infill:
-                x_2, x_1 = (np.round(line_bound[3], 5), 
-                            np.round(line_bound[0], 5)) 
-                y_2, y_1 = (np.round(line_bound[4], 5), 
-                            np.round(line_bound[1], 5))
-                z_2, z_1 = (np.round(line_bound[5], 5), 
-                            np.round(line_bound[2], 5))
-                x_squared = (previous_line_bounds[0] - x_1) ** 2
-                y_squared = (previous_line_bounds[1] - y_1) ** 2
-                distance_next = float(np.sqrt(x_squared + y_squared))
-                spacing = self.nozzle_diameter * 1.18
-                
-                #Retraction
-                if (abs(distance_next - spacing) > spacing and 
-                    abs(distance_next - spacing) > spacing):
-                    gcode_body += ("G92 E0\n"+
-                                   f"G1 E-{self.retraction_length} F{feed_rate_retraction}\n")
-                    gcode_body += (f"G0 F{feed_rate_G0} " + 
-                                   f"X{x_1} Y{y_1} Z{z_1}\n")
-                    gcode_body += (f"G1 E0.1200 F{feed_rate_retraction}\n" +
-                                    "G92 E0\n")
-                    E = 0
-                else:
-                    gcode_body += f"G0 F{feed_rate_G0} X{x_1} Y{y_1} Z{z_1} \n"
-                distance = np.sqrt((y_2 - y_1) ** 2 + (x_2 - x_1) ** 2)
-                volume = distance * self.layer_height * self.nozzle_diameter
-                E += volume / (self.filament_diameter ** 2) 
-                gcode_body += (f"G1 F{feed_rate_G1} " + 
-                               f"X{x_2} Y{y_2} Z{z_2} E{E} \n")
-                previous_line_bounds = np.array([x_2, y_2])
-                
-            print("layer:", current_layer,"/", self.layer_count)
-            
-        end_height = round(self.layer_height * (self.layer_count + 2))
-        gcode_body += self.end_gcode.format(raise_height = end_height)
+                print("Model was successfully sliced!")
+        finally:
+            moves_file.close()
+            breaks_file.close()
+        if len(layer_offsets) != self.layer_count + 1:
+            shutil.rmtree(self.toolpath_address)
+            return "error"
+        
+        radii = self.layer_height * layers + (self.cylinder_diameter / 2)
+        np.save(os.path.join(self.toolpath_address, "radii.npy"), radii)
+        np.save(os.path.join(self.toolpath_address, "layer_offsets.npy"), 
+                np.array(layer_offsets))
+        np.save(os.path.join(self.toolpath_address, "path_offsets.npy"), 
+                np.array(path_offsets))
+        np.save(settings_address, self.toolpath_settings())
+        self.cache.measure_entry(self.cache_key)
+        self.cache.evict(self.cache_key)
+        return ""
+    
+    def load_toolpaths(self) -> dict:
+        """
+        Returns the arrays of the toolpath file (see slice_toolpaths). The 
+        moves and breaks are memory mapped so only the layer being emitted 
+        is read from disk.
+        """
+        toolpaths = dict()
+        for name in ["radii", "layer_offsets", "path_offsets"]:
+            toolpaths[name] = np.load(os.path.join(self.toolpath_address, 
+                                                   name + ".npy"))
+        for name in ["moves", "breaks"]:
+            address = os.path.join(self.toolpath_address, name + ".npy")
+            if toolpaths["path_offsets"][-1] == 0:
+                #An empty file can not be memory mapped
+                toolpaths[name] = np.load(address)
+            else:
+                toolpaths[name] = np.load(address, mmap_mode = 'r')
+        return toolpaths
+    
+    def emit_chunks(self) -> Iterator[str]:
+        """
+        Generator that yields the Gcode of the toolpath file in order: the 
+        header and start Gcode, the Gcode of every layer and the end Gcode.
+        Only the print settings are used, so the Gcode can be emitted again 
+        with different print settings without slicing the model again.
+        """
+        toolpaths = self.load_toolpaths()
+        layer_offsets = toolpaths["layer_offsets"]
+        path_offsets = toolpaths["path_offsets"]
+        layer_count = len(toolpaths["radii"])
+        
+        E = 0 # extrusion length mm
         gcode_header = self.header.format(flavor = self.flavor, 
                                           layer_height = self.layer_height) 
         gcode_start = self.start_gcode.format(print_temperature = self.print_temperature, 
                                               layer_height = self.layer_height, 
                                               stl_file_address = self.stl_file_address,
-                                              layer_count = self.layer_count)
-        gcode = gcode_header + gcode_start + gcode_body 
-        print("Model was successfully sliced!")
-        return gcode
+                                              layer_count = layer_count)
+        yield gcode_header + gcode_start
+        for layer in range(layer_count):
+            gcode_layer = [f";layer:{layer + 1}\n"]
+            first_path = layer_offsets[layer]
+            infill_path = layer_offsets[layer + 1] - 1
+            
+            #Moves of the whole layer, E continues across its paths
+            start = path_offsets[first_path]
+            end = path_offsets[infill_path + 1]
+            moves = np.array(toolpaths["moves"][start:end])
+            breaks = np.array(toolpaths["breaks"][start:end])
+            E_values = self.extrusion_values(moves, breaks, E)
+            if len(moves) != 0:
+                E = E_values[-1]
+            
+            #Print the outer and inner borders of the model, then the infill
+            for path in range(first_path, infill_path + 1):
+                i = path - first_path
+                if path == infill_path:
+                    gcode_layer += [";infill\n"]
+                else:
+                    if i == 0:
+                        gcode_layer += [f";outer-wall\n"]
+                    gcode_layer += [f";wall:{i + 1}\n"]
+                a = path_offsets[path] - start
+                b = path_offsets[path + 1] - start
+                gcode_layer += [self.format_moves(moves[a:b], breaks[a:b], 
+                                                  E_values[a:b])]
+            yield "".join(gcode_layer)
+            
+        end_height = round(self.layer_height * (layer_count + 2))
+        yield self.end_gcode.format(raise_height = end_height)
+    
+    def plan_path(self, moves:np.ndarray, 
+                  spacing:float = None) -> (np.ndarray, np.ndarray):
+        """
+        Plans how every move of an (K, 6) array of moves is reached. 
+        Returns the rounded moves and the break of every move:
+            0: the move continues from the end of the last move
+            1: travel, a G0 move to the start point
+            2: retract, a retraction, a G0 move to the start point and the
+               return of the filament
+        The path starts from (0, 0). For walls (no spacing) a move is 
+        preceded by a retraction when it does not start where the last 
+        move ended. For infill a move is preceded by a retraction when 
+        the distance d from the end of the last move satisfies
+            |d - spacing| > spacing
+        and by a travel move otherwise.
+        """
+        moves = np.round(moves, 5)
+        previous = np.zeros((len(moves), 2))
+        previous[1:] = moves[:-1, 3:5]
+        start = moves[:, 0:2]
+        if spacing is None:
+            retract = np.all(abs(previous - start) > self.epsilon, axis = 1)
+            breaks = np.where(retract, 2, 0)
+        else:
+            distance_next = np.hypot(*(previous - start).T)
+            retract = abs(distance_next - spacing) > spacing
+            breaks = np.where(retract, 2, 1)
+        return moves, breaks.astype(np.int8)
+    
+    def extrusion_values(self, moves:np.ndarray, breaks:np.ndarray, 
+                         E:float) -> np.ndarray:
+        """
+        Returns the extrusion length E at the end of every move, where "E" 
+        is the extrusion length before the first move. 
+        
+        The retractions are the break points of the path. Each one is 
+        followed by G92 E0 so E is a cumulative sum of the extrusion 
+        lengths that restarts at every retraction:
+            E_k = sum(e_j) for the moves j from the last retraction to k
+        """
+        distance = np.hypot(moves[:, 3] - moves[:, 0], 
+                            moves[:, 4] - moves[:, 1])
+        volume = distance * self.layer_height * self.nozzle_diameter
+        extrusion = volume / (self.filament_diameter ** 2)
+        
+        #Segmented cumulative sum that restarts at every retraction
+        total = np.cumsum(extrusion)
+        moves_num = np.arange(len(moves))
+        last_break = np.maximum.accumulate(np.where(breaks == 2, 
+                                                    moves_num, -1))
+        return total - np.where(last_break >= 0, 
+                                (total - extrusion)[last_break], -E)
+    
+    def format_moves(self, moves:np.ndarray, breaks:np.ndarray, 
+                     E_values:np.ndarray) -> str:
+        """
+        Returns the Gcode of an (K, 6) array of moves planned by plan_path.
+        Every move extrudes from its start point to its end point, where 
+        the extrusion length is given by E_values, and is preceded by the
+        travel or retraction of its break (E restarts from 0 after a 
+        retraction). The Gcode is formatted with one fixed precision format
+        string that holds the template of every move.
+        """
+        if len(moves) == 0:
+            return ""
+        feed_rate_G1 = self.print_speed * 60 #mm/min
+        feed_rate_G0 = self.print_speed * 60 #mm/min
+        feed_rate_retraction = self.retraction_speed * 60 #mm/min
+        
+        extrude_line = (f"G1 F{feed_rate_G1} " + 
+                        "X%.5f Y%.5f Z%.5f E%.5f\n")
+        travel_line = f"G0 F{feed_rate_G0} X%.5f Y%.5f Z%.5f\n"
+        retract_lines = ("G92 E0\n" + 
+                         f"G1 E-{self.retraction_length} F{feed_rate_retraction}\n" + 
+                         travel_line + 
+                         f"G1 E0.1200 F{feed_rate_retraction}\n" + 
+                         "G92 E0\n")
+        templates = np.array([extrude_line, 
+                              travel_line + extrude_line, 
+                              retract_lines + extrude_line], dtype = object)
+        
+        values = np.empty((len(moves), 7))
+        values[:, :6] = moves
+        values[:, 6] = E_values
+        values += 0.0 #no negative zeros
+        used = np.ones((len(moves), 7), dtype = bool)
+        used[breaks == 0, :3] = False
+        return "".join(templates[breaks]) % tuple(values[used].tolist())
+    
+    def toolpaths(self) -> Iterator:
+        """
+        Generator that yields the toolpath of every layer in order (see 
+        layer_toolpath). 
+        
+        With one process the layers are sliced by sweeping the cylinder 
+        outwards. With more processes the layers are spread across a pool 
+        of worker processes that each hold a copy of this parser and slice
+        their layers independently. The arrays of the mesh are placed in 
+        shared memory first so the workers attach to them instead of 
+        receiving a copy. The workers are started with "spawn" since the 
+        parser can run in a thread of the GUI and forking a process with
+        running threads can deadlock it. The results are yielded in layer 
+        order so the Gcode is the same for any number of processes.
+        """
+        layers = np.arange(1, self.layer_count + 1)
+        if self.process_count > 1:
+            chunksize = max(1, self.layer_count // (4 * self.process_count))
+            self.slicer.share_memory()
+            context = multiprocessing.get_context("spawn")
+            executor = ProcessPoolExecutor(self.process_count, 
+                                           mp_context = context,
+                                           initializer = init_worker, 
+                                           initargs = (self,))
+            try:
+                yield from executor.map(slice_layer, layers, 
+                                        chunksize = chunksize)
+            finally:
+                #Layers left unsliced after an error are cancelled
+                executor.shutdown(cancel_futures = True)
+                self.slicer.release_memory()
+        else:
+            radii = self.layer_height * layers + (self.cylinder_diameter / 2)
+            sweep = self.slicer.sweep_edges(radii)
+            for current_layer, (r, edges) in zip(layers, sweep):
+                yield self.layer_toolpath(current_layer, edges)
+    
+    def layer_toolpath(self, current_layer:int, edges:np.ndarray) -> tuple:
+        """
+        Returns the toolpath of a layer from the edges of its slice as a 
+        tuple holding:
+            - a list with an array of the loops of every wall
+            - an array of the ordered infill lines
+            - the spacing between the infill lines (None without infill)
+        If the layer can not be sliced the error message is returned.
+        """
+        if isinstance(edges, str):
+            return "Error: No intersection points found."
+        walls = self.slicer.create_loops(edges)
+        if isinstance(walls, str):
+            return ("Error: Unable to make closed loop.\n" +
+                    f"Unmatched end points: {self.slicer.unmatched_endpoints}")
+        
+        #The walls are printed island by island, every loop enclosing the
+        #mesh followed by the holes inside of it
+        loops = [loop for island in self.slicer.islands() for loop in island]
+        wall_rings = self.slicer.offset_loops(self.wall_line_count, loops, [])
+        if self.slicer.collapsed_walls != 0:
+            print(f"Layer {current_layer}: {self.slicer.collapsed_walls} " +
+                  f"of {self.wall_line_count} walls do not fit and were " +
+                  "left out.")
+
+        #Alternate the slice orientation between the infill orientation
+        #and the infill orientation + 90 degrees
+        if current_layer % 2 == 1:
+            slice_orientation = self.infill_orientation + 90
+        else:
+            slice_orientation = self.infill_orientation
         
-    def write_gcode(self, gcode:str) -> None:
+        #The innermost and outermost layers are solid
+        if (current_layer <= self.solid_layer_count) or \
+           (current_layer > self.layer_count - self.solid_layer_count):
+            infill_percentage = 100
+        else:
+            infill_percentage = self.infill_percentage
+        
+        #Infill inside of the innermost wall
+        wall = np.empty((0, 6))
+        if len(wall_rings) != 0:
+            wall = wall_rings[-1]
+        infill, spacing = np.empty((0, 6)), None
+        if infill_percentage > 0:
+            infill = self.slicer.infill(wall, slice_orientation, 
+                                        infill_percentage, 
+                                        self.infill_pattern) 
+            spacing = self.slicer.infill_spacing(infill_percentage, 
+                                                 self.infill_pattern)
+        return wall_rings, infill, spacing
+    
+    def write_gcode(self, gcode:str = None) -> str:
+        """
+        Writes the Gcode to the file. If no Gcode is given the layers are 
+        sliced and written through a buffered file one at a time as they 
+        are completed, so the memory used does not grow with the size of 
+        the Gcode. The partially written file is removed if slicing fails
+        or raises an exception.
+        """
         print("Writing Gcode...")
-        gcode_file = open(self.gcode_file_address + ".gcode", 'w')
-        gcode_file.write(gcode)
-        gcode_file.close()
-        print("The Gcode is ready!")
\ No newline at end of file
+        file_address = self.gcode_file_address + ".gcode"
+        if gcode is None:
+            chunks = self.gcode_chunks()
+        else:
+            chunks = [gcode]
+        completed = False
+        try:
+            with open(file_address, 'w', buffering = 1 << 20) as gcode_file:
+                for chunk in chunks:
+                    if chunk == "error":
+                        break
+                    gcode_file.write(chunk)
+                else:
+                    completed = True
+        finally:
+            if not completed and os.path.isfile(file_address):
+                os.remove(file_address)
+        if not completed:
+            return "error"
+        print("The Gcode is ready!")
+        return ""
+
+
+class array_file:
+    """
+    .npy file that rows with a fixed shape are appended to, so an array 
+    that does not fit in memory can be written one part at a time. numpy 
+    pads the header of .npy files so the length of the first axis can grow
+    in place, the header is rewritten with the final length on close.
+    """
+    def __init__(self, file_address:str, row_shape:tuple, 
+                 dtype:type = np.float64):
+        self.file = open(file_address, 'wb')
+        self.row_shape = row_shape
+        self.dtype = np.dtype(dtype)
+        self.size = 0
+        self.write_header()
+        
+    def write_header(self) -> None:
+        header = {'descr': np.lib.format.dtype_to_descr(self.dtype), 
+                  'fortran_order': False, 
+                  'shape': (self.size,) + self.row_shape}
+        self.file.seek(0)
+        np.lib.format.write_array_header_1_0(self.file, header)
+        self.file.seek(0, os.SEEK_END)
+        
+    def append(self, rows:np.ndarray) -> None:
+        rows = np.ascontiguousarray(rows, dtype = self.dtype)
+        self.file.write(rows.tobytes())
+        self.size += len(rows)
+    
+    def close(self) -> None:
+        if not self.file.closed:
+            self.write_header()
+            self.file.close()
+
+
+#Parser of the worker process
+worker_parser = None
+
+def init_worker(parser:gcode_parser) -> None:
+    global worker_parser
+    worker_parser = parser
+
+def slice_layer(current_layer:int) -> tuple:
+    """
+    Slices one layer in a worker process, see gcode_parser.toolpaths.
+    """
+    parser = worker_parser
+    r = parser.layer_height * current_layer + (parser.cylinder_diameter / 2)
+    edges = parser.slicer.gather_edges(r)
+    return parser.layer_toolpath(current_layer, edges)
\ No newline at end of file
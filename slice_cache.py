@@ -0,0 +1,213 @@
+"""
+<slice_cache.py keeps sliced models on disk so they are not sliced again.>
+Copyright (C) <2020>  <Luke Vandenberghe>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+"""
+Last updated: October 26, 2020
+"""
+
+#Imports
+import numpy as np
+import hashlib
+import os
+import shutil
+
+class slice_cache:
+    """
+    Cache of sliced models in a directory on disk. Every model has an entry
+    named after the key of the model (see model_key), a directory holding:
+        model.npy:         the maximum radius of the model
+        layer_<n>.npy:     the edges of the slice of layer n
+        toolpath_<key>:    the toolpath files of the model, one for every
+                           set of toolpath settings (see
+                           gcode_parser.slice_toolpaths)
+    The entries are evicted least recently used first once the total size
+    of the cache is larger than cache_size (MB). Nothing is cached if 
+    cache_directory is None.
+    """
+    def __init__(self, cache_directory:str, cache_size:float):
+        self.cache_directory = cache_directory
+        self.cache_size = cache_size * 1000000 #bytes
+        
+        #Size of every entry in bytes, measured once and then kept up to 
+        #date as files are stored (see entry_sizes and evict)
+        self.sizes = None
+
+    def enabled(self) -> bool:
+        return self.cache_directory is not None
+
+    def model_key(self, stl_file_address:str, rotation_x:float, 
+                  rotation_y:float, rotation_z:float, location_x:float, 
+                  location_y:float, location_z:float, 
+                  cylinder_diameter:float, delta_y:float, 
+                  layer_height:float, nozzle_diameter:float) -> str:
+        """
+        Returns the key of a model, the SHA-256 hash of the bytes of the
+        STL file and of the settings that change the slices of the model.
+        The key does not depend on the name or location of the STL file.
+        """
+        key = hashlib.sha256()
+        with open(stl_file_address, 'rb') as stl_file:
+            for block in iter(lambda: stl_file.read(1 << 20), b""):
+                key.update(block)
+        settings = [rotation_x, rotation_y, rotation_z, 
+                    location_x, location_y, location_z, 
+                    cylinder_diameter, delta_y, layer_height, nozzle_diameter]
+        key.update(repr([float(setting) for setting in settings]).encode())
+        return key.hexdigest()
+
+    def settings_key(self, settings:list) -> str:
+        """
+        Returns the key of a set of settings within the entry of a model.
+        """
+        settings = repr([str(setting) for setting in settings]).encode()
+        return hashlib.sha256(settings).hexdigest()[:16]
+
+    def entry(self, key:str) -> str:
+        """
+        Returns the address of the entry of a model, created if it does not
+        exist yet, and marks the entry as the most recently used.
+        """
+        entry_address = os.path.join(self.cache_directory, key)
+        os.makedirs(entry_address, exist_ok = True)
+        os.utime(entry_address)
+        return entry_address
+
+    def max_radius(self, key:str) -> float:
+        """
+        Returns the maximum radius of a model or None if it is not cached.
+        """
+        if not self.enabled():
+            return None
+        model_address = os.path.join(self.cache_directory, key, "model.npy")
+        if not os.path.isfile(model_address):
+            return None
+        return float(np.load(model_address)[0])
+
+    def store_max_radius(self, key:str, max_radius:float) -> None:
+        self.store_array(key, "model.npy", np.array([max_radius]))
+        self.evict(key)
+
+    def layer_edges(self, key:str, layer:int) -> np.ndarray:
+        """
+        Returns the edges of the slice of a layer or None if it is not
+        cached.
+        """
+        if not self.enabled():
+            return None
+        layer_address = os.path.join(self.cache_directory, key,
+                                     f"layer_{layer}.npy")
+        if not os.path.isfile(layer_address):
+            return None
+        self.entry(key)
+        return np.load(layer_address)
+
+    def store_layer_edges(self, key:str, layers:dict) -> None:
+        """
+        Stores the edges of the slices of several layers, given as a 
+        dictionary from the layer number to its edges, and evicts entries 
+        once for all of them.
+        """
+        for layer, edges in layers.items():
+            self.store_array(key, f"layer_{layer}.npy", edges)
+        self.evict(key)
+
+    def store_array(self, key:str, name:str, array:np.ndarray) -> None:
+        """
+        Saves an array to the entry of a model and adds the change in the 
+        size of the file to the size of the entry.
+        """
+        if not self.enabled():
+            return
+        sizes = self.entry_sizes()
+        file_address = os.path.join(self.entry(key), name)
+        previous_size = 0
+        if os.path.isfile(file_address):
+            previous_size = os.path.getsize(file_address)
+        np.save(file_address, array)
+        sizes[key] = sizes.get(key, 0) + \
+                     os.path.getsize(file_address) - previous_size
+
+    def entry_sizes(self) -> dict:
+        """
+        Returns the size of every entry in bytes. The entries are only 
+        walked the first time, afterwards the sizes are updated as files 
+        are stored (see store_array and measure_entry) or measured again 
+        once the cache is too large (see evict).
+        """
+        if self.sizes is None:
+            self.sizes = dict()
+            if os.path.isdir(self.cache_directory):
+                for entry in os.scandir(self.cache_directory):
+                    if entry.is_dir():
+                        self.sizes[entry.name] = self.entry_size(entry.path)
+        return self.sizes
+
+    def measure_entry(self, key:str) -> None:
+        """
+        Measures the size of an entry again after files were written to it
+        directly, like the toolpath files.
+        """
+        if not self.enabled():
+            return
+        sizes = self.entry_sizes()
+        sizes[key] = self.entry_size(os.path.join(self.cache_directory, key))
+
+    def entry_size(self, entry_address:str) -> int:
+        """
+        Returns the total size of the files of an entry in bytes.
+        """
+        size = 0
+        for directory, _, files in os.walk(entry_address):
+            for file in files:
+                size += os.path.getsize(os.path.join(directory, file))
+        return size
+
+    def evict(self, keep:str = None) -> None:
+        """
+        Removes the least recently used entries until the total size of
+        the cache is at most cache_size. The entry "keep" that is in use is
+        never removed. The entries are only looked up on disk when the 
+        cache is too large: the sizes are then measured again, since other
+        instances (another GUI or gcode_parser) may have stored or removed 
+        files that this instance did not track.
+        """
+        if not self.enabled():
+            return
+        if sum(self.entry_sizes().values()) <= self.cache_size:
+            return
+        self.sizes = None
+        sizes = self.entry_sizes()
+        total_size = sum(sizes.values())
+        if total_size <= self.cache_size:
+            return
+        entries = []
+        for key, size in list(sizes.items()):
+            entry_address = os.path.join(self.cache_directory, key)
+            if not os.path.isdir(entry_address):
+                total_size -= size
+                del sizes[key]
+                continue
+            entries += [(os.stat(entry_address).st_mtime, key, size)]
+        for _, key, size in sorted(entries):
+            if total_size <= self.cache_size:
+                break
+            if key != keep:
+                shutil.rmtree(os.path.join(self.cache_directory, key),
+                              ignore_errors = True)
+                total_size -= size
+                del sizes[key]
@@ -34,6 +34,7 @@ import stl_to_egg_converter as stl2egg
 import gcode_parser as gp
 import layer_simulation as layersim
 import cylindrical_slicer as cs
+import slice_cache as sc
 import configuration as config
 
 #Other Imports
@@ -42,6 +43,7 @@ import tkinter.filedialog
 import numpy as np
 import threading
 import time
+from collections import OrderedDict
 
 confVars = """
 win-size 1920 1080
@@ -79,6 +81,12 @@ class slicer_gui (ShowBase):
         self.delta_y = config.delta_y
         self.filament_diameter = config.filament_diameter
         self.infill_orientation = config.infill_orientation
+        self.infill_pattern = config.infill_pattern
+        self.solid_layer_count = config.solid_layer_count
+        self.process_count = config.process_count
+        self.cache_directory = config.cache_directory
+        self.cache_size = config.cache_size
+        self.cache = sc.slice_cache(self.cache_directory, self.cache_size)
 
         #Background Color
         base.setBackgroundColor(0.1, 0.1, 0.1)
@@ -137,6 +145,17 @@ class slicer_gui (ShowBase):
         #starting layer
         self.layer_number = 1
         
+        #Slicer of the current transform and its recently viewed layers
+        self.slicer = None
+        self.slicer_model = None
+        self.slicer_transform = None
+        self.layer_edges = OrderedDict()
+        self.layer_edges_size = 64
+        
+        #Sliced layers that are not in the slice cache yet (see storeLayers)
+        self.unsaved_layers = dict()
+        self.unsaved_layers_size = 16
+        
         #disables default mouse control
         self.disableMouse()
         # Define camera parameters
@@ -348,7 +367,6 @@ class slicer_gui (ShowBase):
         self.stl.setHpr(self.original_rotation_z + self.rotation_z,
                         self.original_rotation_y + self.rotation_y, 
                         self.original_rotation_x + self.rotation_x)
-        pt1, pt2 = self.stl.getTightBounds()
         self.stl.setTransparency(TransparencyAttrib.MAlpha)
         self.stl.setColorScale(0.3, 0.3, 0.3, 1)
         self.stl.setPos(self.location_x + self.origin_x, 
@@ -357,8 +375,11 @@ class slicer_gui (ShowBase):
         self.stl.setScale(1, 1, 1)
         self.stl.reparentTo(self.render)
         
-        #Display the dimensions of the model
-        pt1, pt2 = self.stl.getTightBounds()  
+        #Display the dimensions of the model (the bounds are measured again
+        #when the model is rotated and moved with its location, see 
+        #refreshMeshCenter and setTextLocationX)
+        self.stl_bounds = self.stl.getTightBounds()
+        pt1, pt2 = self.stl_bounds
         self.dimension_x = round(max(pt1[0], pt2[0]) - min(pt1[0], pt2[0]), 2)
         self.dimension_y = round(max(pt1[1], pt2[1]) - min(pt1[1], pt2[1]), 2)
         self.dimension_z = round(max(pt1[2], pt2[2]) - min(pt1[2], pt2[2]), 2)
@@ -403,6 +424,29 @@ class slicer_gui (ShowBase):
         self.done = True
         
         
+    def centerAxis(self) -> None:
+        """
+        Places the coordinate axis at the center of the bounds of the model.
+        """
+        pt1, pt2 = self.stl_bounds
+        self.x_stl = (max(pt1[0], pt2[0]) + min(pt1[0], pt2[0])) / 2
+        self.y_stl = (max(pt1[1], pt2[1]) + min(pt1[1], pt2[1])) / 2
+        self.z_stl = (max(pt1[2], pt2[2]) + min(pt1[2], pt2[2])) / 2 
+        self.origin.setPos(self.x_stl, self.y_stl, self.z_stl)
+        self.x_axis.setPos(self.x_stl, self.y_stl, self.z_stl)
+        self.y_axis.setPos(self.x_stl, self.y_stl, self.z_stl)
+        self.z_axis.setPos(self.x_stl, self.y_stl, self.z_stl)
+    
+    def refreshMeshCenter(self) -> None:
+        """
+        Measures the bounds of the model again after it was rotated. The 
+        model is rotated about the origin of the STL file, not its center,
+        so the center of the bounds moves with the rotation. A move only 
+        shifts the bounds, see setTextLocationX.
+        """
+        self.stl_bounds = self.stl.getTightBounds()
+        self.centerAxis()
+    
     def displayMeshCenter (self) -> None:
         #Show coordiante axis
         self.origin = self.loader.loadModel(r"\EGG\origin.egg")
@@ -431,14 +475,7 @@ class slicer_gui (ShowBase):
         self.z_axis.setColorScale(0, 0, 255, 1)
         
         #Center it the coordinate axis at the center of the model
-        pt1, pt2 = self.stl.getTightBounds()
-        self.x_stl = (max(pt1[0], pt2[0]) + min(pt1[0], pt2[0])) / 2
-        self.y_stl = (max(pt1[1], pt2[1]) + min(pt1[1], pt2[1])) / 2
-        self.z_stl = (max(pt1[2], pt2[2]) + min(pt1[2], pt2[2])) / 2 
-        self.origin.setPos(self.x_stl, self.y_stl, self.z_stl)
-        self.x_axis.setPos(self.x_stl, self.y_stl, self.z_stl)
-        self.y_axis.setPos(self.x_stl, self.y_stl, self.z_stl)
-        self.z_axis.setPos(self.x_stl, self.y_stl, self.z_stl)
+        self.centerAxis()
         self.x_axis.setHpr(90, 90, 0)
         self.y_axis.setHpr(180, 90, 0)
         self.z_axis.setHpr(0, 0, 0)
@@ -961,22 +998,106 @@ class slicer_gui (ShowBase):
         self.infill_orientation_value_NodePath.setPos(1.31, 0, -0.5)
         
         
-    def layerViewerInfo(self) -> None:
-        slicer = cs.cylindrical_slicer(self.stl_file_address, 
-                                       self.nozzle_diameter, 
-                                       self.rotation_x, 
-                                       self.rotation_y, 
-                                       self.rotation_z, 
-                                       self.location_x, 
-                                       self.location_y, 
-                                       self.location_z, 
-                                       self.cylinder_diameter, 
-                                       self.delta_y)
-        #Layer count 
-        self.layer_count =int((slicer.max_radius - (self.cylinder_diameter / 2)) / self.layer_height) - 1
+    def updateTransform(self) -> None:
+        """
+        Starts over with the layers of the current transform when the 
+        model, its transform or the slicing settings have changed since 
+        the last layer was viewed. The live slicer is only dropped when the
+        model or the cylinder changed, a new location or rotation is 
+        applied to it once a layer is not found in the cache.
+        """
+        transform = (self.stl_file_address, 
+                     self.rotation_x, self.rotation_y, self.rotation_z, 
+                     self.location_x, self.location_y, self.location_z, 
+                     self.cylinder_diameter, self.delta_y, 
+                     self.layer_height, self.nozzle_diameter)
+        if transform == self.slicer_transform:
+            return
+        model = (self.stl_file_address, self.cylinder_diameter, 
+                 self.delta_y, self.nozzle_diameter)
+        if model != self.slicer_model:
+            self.slicer = None
+        self.storeLayers()
+        self.slicer_model = model
+        self.slicer_transform = transform
+        self.layer_edges.clear()
+        self.cache_key = self.cache.model_key(*transform)
+        self.max_radius = self.cache.max_radius(self.cache_key)
+    
+    def liveSlicer(self) -> cs.cylindrical_slicer:
+        """
+        Returns the slicer of the current transform. The slicer is created 
+        on first use and transformed again when the location or rotation 
+        changed, without loading the STL file again.
+        """
+        rotation = (self.rotation_x, self.rotation_y, self.rotation_z)
+        location = (self.location_x, self.location_y, self.location_z)
+        if self.slicer is None:
+            self.slicer = cs.cylindrical_slicer(self.stl_file_address, 
+                                                self.nozzle_diameter, 
+                                                self.rotation_x, 
+                                                self.rotation_y, 
+                                                self.rotation_z, 
+                                                self.location_x, 
+                                                self.location_y, 
+                                                self.location_z, 
+                                                self.cylinder_diameter, 
+                                                self.delta_y)
+        elif (self.slicer.rotation_x, self.slicer.rotation_y, 
+              self.slicer.rotation_z, self.slicer.location_x, 
+              self.slicer.location_y, self.slicer.location_z) != rotation + location:
+            self.slicer.set_transform(*rotation, *location)
+        #The maximum radius is stored again if it is not in the cache, the
+        #entry may have been evicted while the slicer was kept
+        self.max_radius = self.slicer.max_radius
+        if self.cache.max_radius(self.cache_key) is None:
+            self.cache.store_max_radius(self.cache_key, self.max_radius)
+        return self.slicer
+    
+    def storeLayers(self) -> None:
+        """
+        Writes the layers sliced by the live slicer to the slice cache in 
+        one batch.
+        """
+        if len(self.unsaved_layers) != 0:
+            self.cache.store_layer_edges(self.cache_key, self.unsaved_layers)
+            self.unsaved_layers = dict()
+    
+    def sliceLayer(self) -> tuple:
+        """
+        Returns the edges of the slice of the current layer and its radius.
+        The edges are looked up in the recently viewed layers, then in the 
+        slice cache, and are only sliced by the live slicer of the current 
+        transform if the layer was not sliced before. The recently viewed 
+        layers are kept least recently used first. Newly sliced layers are
+        written to the slice cache in batches of unsaved_layers_size and
+        when the transform changes. Updates the layer count.
+        """
+        self.updateTransform()
         radius = self.layer_height * self.layer_number + (self.cylinder_diameter / 2)
-        edges = slicer.gather_edges(radius)
-        if str(edges) != "error":
+        if self.layer_number in self.layer_edges:
+            self.layer_edges.move_to_end(self.layer_number)
+            edges = self.layer_edges[self.layer_number]
+        else:
+            edges = self.cache.layer_edges(self.cache_key, self.layer_number)
+            if edges is None:
+                edges = self.liveSlicer().gather_edges(radius)
+                if not isinstance(edges, str):
+                    self.unsaved_layers[self.layer_number] = edges
+                    if len(self.unsaved_layers) >= self.unsaved_layers_size:
+                        self.storeLayers()
+            self.layer_edges[self.layer_number] = edges
+            if len(self.layer_edges) > self.layer_edges_size:
+                self.layer_edges.popitem(last = False)
+        if self.max_radius is None:
+            self.liveSlicer()
+        #Layer count 
+        self.layer_count =int((self.max_radius - (self.cylinder_diameter / 2)) / self.layer_height) - 1
+        return edges, radius
+    
+    def layerViewerInfo(self) -> None:
+        edges, radius = self.sliceLayer()
+        if not isinstance(edges, str):
             #Create a picture of the layer
             layer_sim = layersim.layer_viewer(edges, radius, self.layer_number,
                                               self.location_x, self.location_y,
@@ -1119,27 +1240,15 @@ class slicer_gui (ShowBase):
                                          align=False)
         
     def setTextLayerNumber(self, textEntered:str) -> None:
-        slicer = cs.cylindrical_slicer(self.stl_file_address, 
-                                       self.nozzle_diameter, 
-                                       self.rotation_x, 
-                                       self.rotation_y, 
-                                       self.rotation_z, 
-                                       self.location_x, 
-                                       self.location_y, 
-                                       self.location_z, 
-                                       self.cylinder_diameter, 
-                                       self.delta_y)
         try:
             self.layer_number = int(textEntered)
-            self.layer_count = int((slicer.max_radius - (self.cylinder_diameter / 2)) / self.layer_height) - 1
-            radius = self.layer_height * self.layer_number + (self.cylinder_diameter / 2)
-            edges = slicer.gather_edges(radius)
+            edges, radius = self.sliceLayer()
             radius = round(radius, 2)
         except ValueError:
             edges = "error"
             radius = "nan"
         
-        if str(edges) != "error":
+        if not isinstance(edges, str):
             self.layer.destroy()
             layer_sim = layersim.layer_viewer(edges, radius, self.layer_number,
                                               self.location_x, self.location_y,
@@ -1535,17 +1644,15 @@ class slicer_gui (ShowBase):
     
     def setTextLocationX(self, textEntered:str) -> None:
         try:
-            self.location_x = float(textEntered)
+            location_x = float(textEntered)
+            #The center of the model moves with its location
+            self.x_stl += location_x - self.location_x
+            self.location_x = location_x
             self.location_x_value.setText(f"{self.location_x}") 
             self.location_x_entry.destroy()            
             self.stl.setPos(self.origin_x + self.location_x, 
                             self.origin_y + self.location_y, 
                             self.origin_z + self.location_z)
-            
-            pt1, pt2 = self.stl.getTightBounds()
-            self.x_stl = (max(pt1[0], pt2[0]) + min(pt1[0], pt2[0])) / 2
-            self.y_stl = (max(pt1[1], pt2[1]) + min(pt1[1], pt2[1])) / 2
-            self.z_stl = (max(pt1[2], pt2[2]) + min(pt1[2], pt2[2])) / 2 
             self.origin.setPos(self.x_stl, self.y_stl, self.z_stl)
             self.x_axis.setPos(self.x_stl, self.y_stl, self.z_stl)
             self.y_axis.setPos(self.x_stl, self.y_stl, self.z_stl)
@@ -1565,17 +1672,15 @@ class slicer_gui (ShowBase):
 
     def setTextLocationY(self, textEntered:str) -> None:
         try:
-            self.location_y = float(textEntered)
+            location_y = float(textEntered)
+            #The center of the model moves with its location
+            self.y_stl += location_y - self.location_y
+            self.location_y = location_y
             self.location_y_value.setText(f"{self.location_y}") 
             self.location_y_entry.destroy()
             self.stl.setPos(self.origin_x + self.location_x, 
                             self.origin_y + self.location_y, 
                             self.origin_z + self.location_z)
-            
-            pt1, pt2 = self.stl.getTightBounds()
-            self.x_stl = (max(pt1[0], pt2[0]) + min(pt1[0], pt2[0])) / 2
-            self.y_stl = (max(pt1[1], pt2[1]) + min(pt1[1], pt2[1])) / 2
-            self.z_stl = (max(pt1[2], pt2[2]) + min(pt1[2], pt2[2])) / 2 
             self.origin.setPos(self.x_stl, self.y_stl, self.z_stl)
             self.x_axis.setPos(self.x_stl, self.y_stl, self.z_stl)
             self.y_axis.setPos(self.x_stl, self.y_stl, self.z_stl)
@@ -1595,17 +1700,15 @@ class slicer_gui (ShowBase):
         
     def setTextLocationZ(self, textEntered:str) -> None:
         try:
-            self.location_z = float(textEntered)
+            location_z = float(textEntered)
+            #The center of the model moves with its location
+            self.z_stl += location_z - self.location_z
+            self.location_z = location_z
             self.location_z_value.setText(f"{self.location_z}") 
             self.location_z_entry.destroy()
             self.stl.setPos(self.origin_x + self.location_x, 
                             self.origin_y + self.location_y, 
                             self.origin_z + self.location_z)
-            
-            pt1, pt2 = self.stl.getTightBounds()
-            self.x_stl = (max(pt1[0], pt2[0]) + min(pt1[0], pt2[0])) / 2
-            self.y_stl = (max(pt1[1], pt2[1]) + min(pt1[1], pt2[1])) / 2
-            self.z_stl = (max(pt1[2], pt2[2]) + min(pt1[2], pt2[2])) / 2 
             self.origin.setPos(self.x_stl, self.y_stl, self.z_stl)
             self.x_axis.setPos(self.x_stl, self.y_stl, self.z_stl)
             self.y_axis.setPos(self.x_stl, self.y_stl, self.z_stl)
@@ -1665,6 +1768,7 @@ class slicer_gui (ShowBase):
             self.rotation_x_value.setText(f"{self.rotation_x}") 
             self.rotation_x_entry.destroy()   
             self.stl.setP(self.original_rotation_x + self.rotation_x)
+            self.refreshMeshCenter()
             self.layer.destroy()
             self.label_radius.destroy()
             self.label_layer_count.destroy()
@@ -1683,6 +1787,7 @@ class slicer_gui (ShowBase):
             self.rotation_y_value.setText(f"{self.rotation_y}") 
             self.rotation_y_entry.destroy()
             self.stl.setR(self.original_rotation_y + self.rotation_y)
+            self.refreshMeshCenter()
             self.layer.destroy()
             self.label_radius.destroy()
             self.label_layer_count.destroy()
@@ -1701,6 +1806,7 @@ class slicer_gui (ShowBase):
             self.rotation_z_value.setText(f"{self.rotation_z}") 
             self.rotation_z_entry.destroy()
             self.stl.setH(self.original_rotation_z + self.rotation_z)
+            self.refreshMeshCenter()
             self.layer.destroy()
             self.label_radius.destroy()
             self.label_layer_count.destroy()
@@ -1748,10 +1854,14 @@ class slicer_gui (ShowBase):
                                      self.cylinder_diameter, 
                                      self.delta_y,
                                      self.filament_diameter,
-                                     self.infill_orientation)
-        gcode_file = self.gcode.create_gcode()
-        if str(gcode_file) != "error":
-            self.gcode.write_gcode(gcode_file)
+                                     self.infill_orientation,
+                                     self.infill_pattern,
+                                     self.solid_layer_count,
+                                     self.process_count,
+                                     self.cache_directory,
+                                     self.cache_size,
+                                     self.cache)
+        if self.gcode.write_gcode() != "error":
             self.loading_label.setText("The Gcode is ready!")
         else:
             self.loading_label.setText("Failed to prepare Gcode.")